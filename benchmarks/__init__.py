@@ -0,0 +1,9 @@
+"""
+Reproducible benchmarks of the world generation, lighting and rendering.
+Run them from the root of the repo with `python -m benchmarks` (see `python -m benchmarks --help`).
+"""
+import os
+
+
+# the benchmarks never open a window, this has to be set before src.window gets imported
+os.environ.setdefault("BLOCKS_HEADLESS", "1")
@@ -0,0 +1,91 @@
+import argparse
+import json
+import platform
+import sys
+from pathlib import Path
+#
+import numpy as np
+import pygame
+from colorama import Fore
+#
+from . import scenarios
+from .bench import SCENARIOS, SEED, run, compare
+
+
+# C O N S T A N T S
+BASELINE = Path("benchmarks", "baseline.json")
+OUTPUT = Path("logs", "benchmarks.json")
+
+
+# F U N C T I O N S
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Runs the benchmarks headlessly and compares them against the baseline.")
+    parser.add_argument("names", nargs="*", help=f"scenarios to run (all by default): {', '.join(SCENARIOS)}")
+    parser.add_argument("--kind", choices=("micro", "macro"), help="only run the micro or macro scenarios")
+    parser.add_argument("--output", type=Path, default=OUTPUT, help="where the results are written as JSON")
+    parser.add_argument("--baseline", type=Path, default=BASELINE, help="results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="how much slower (relative) than the baseline a metric may get")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline instead of comparing")
+    return parser.parse_args()
+
+
+def environment():
+    # where the results come from, timings of different machines can't be compared
+    return {
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "system": platform.platform(),
+        "processor": platform.processor(),
+        "seed": SEED,
+        "world": {key: value for key, value in scenarios.WORLD_CONFIG.items() if value != float("inf")},
+    }
+
+
+def main():
+    args = parse_args()
+    unknown = [name for name in args.names if name not in SCENARIOS]
+    if unknown:
+        sys.exit(f"unknown scenarios: {', '.join(unknown)}")
+
+    # run the scenarios
+    results = {}
+    for name, scenario in SCENARIOS.items():
+        if (args.names and name not in args.names) or (args.kind and scenario.kind != args.kind):
+            continue
+        print(f"running {name}...", flush=True)
+        results |= run(scenario)
+    report = {"environment": environment(), "results": results}
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, indent=4))
+    print(f"results written to {args.output}")
+
+    if args.save_baseline:
+        # only the scenarios that ran are replaced
+        baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {"results": {}}
+        baseline = {"environment": report["environment"], "results": baseline["results"] | results}
+        args.baseline.write_text(json.dumps(baseline, indent=4))
+        print(f"baseline written to {args.baseline}")
+        return
+
+    # without a baseline, the results are still shown (as new), but nothing can be said about regressions
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())
+        if baseline["environment"] != report["environment"]:
+            print(Fore.YELLOW + "the baseline comes from a different environment, timings might not be comparable")
+    else:
+        baseline = {"results": {}}
+    lines, failed = compare(results, baseline["results"], args.tolerance)
+    for name, changes, problems in lines:
+        color = Fore.RED if problems else Fore.GREEN
+        print(color + f"{name:<24} {changes}" + (f" <- {'; '.join(problems)}" if problems else ""))
+    if not args.baseline.exists():
+        sys.exit(Fore.RED + f"no baseline at {args.baseline} to compare against, create one with --save-baseline")
+    if failed:
+        sys.exit(Fore.RED + "benchmarks regressed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import time
+import random
+import numpy as np
+from contextlib import contextmanager
+from dataclasses import dataclass
+from collections.abc import Callable
+
+
+# C O N S T A N T S
+SEED = 1234                  # seed of every benchmark world (and of the random module)
+PERCENTILES = (50, 90, 99)
+COMPARED = ("p50", "p90")    # statistics that are compared against the baseline
+
+
+# C L A S S E S
+@dataclass
+class Scenario:
+    name: str
+    func: Callable[["Bench"], None]
+    kind: str                # "micro" or "macro"
+    repeat: int              # number of samples the scenario takes (per metric)
+    warmup: int              # number of samples at the start that are thrown away
+
+
+class Bench:
+    """
+    Handed to a scenario, which does its own setup and times the interesting parts with measure.
+    A scenario can time several metrics (e.g. placing and breaking a torch), which are reported as "scenario.metric".
+    """
+    def __init__(self, scenario):
+        self.scenario = scenario
+        self.repeat = scenario.repeat + scenario.warmup
+        self.samples: dict[str, list[float]] = {}  # in ms
+        self.checksums: set[int] = set()
+        self.errors: list[str] = []
+
+    @contextmanager
+    def measure(self, metric=None):
+        name = self.scenario.name if metric is None else f"{self.scenario.name}.{metric}"
+        start = time.perf_counter()
+        yield
+        self.samples.setdefault(name, []).append((time.perf_counter() - start) * 1000)
+
+    def check(self, checksum):
+        """
+        Records a checksum of the state the scenario ended up in. All runs of a scenario have to end up in the same state,
+        and that state has to match the baseline, otherwise the timings can't be compared.
+        """
+        self.checksums.add(checksum)
+
+    def fail(self, message):
+        """
+        Records that the scenario ended up in a wrong state. The scenario keeps running, but its results count as failed.
+        """
+        self.errors.append(message)
+
+    def results(self):
+        checksum = next(iter(self.checksums)) if len(self.checksums) == 1 else None
+        return {
+            name: stats(samples[self.scenario.warmup:]) | {
+                "kind": self.scenario.kind,
+                "checksum": checksum,
+                "deterministic": len(self.checksums) <= 1,
+                "errors": self.errors,
+            }
+            for name, samples in self.samples.items()
+        }
+
+
+# F U N C T I O N S
+def scenario(kind, repeat, warmup=1):
+    """
+    Registers the decorated function as a benchmark scenario
+    """
+    def decorator(func):
+        SCENARIOS[func.__name__] = Scenario(func.__name__, func, kind, repeat, warmup)
+        return func
+    return decorator
+
+
+def run(scenario_):
+    random.seed(SEED)
+    bench = Bench(scenario_)
+    scenario_.func(bench)
+    return bench.results()
+
+
+def stats(samples):
+    # summary of the samples (in ms)
+    samples = np.array(samples)
+    return {
+        "samples": len(samples),
+        "mean": round(float(samples.mean()), 4),
+        "min": round(float(samples.min()), 4),
+        "max": round(float(samples.max()), 4),
+    } | {f"p{p}": round(float(np.percentile(samples, p)), 4) for p in PERCENTILES}
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compares the results with the baseline. Returns a line per metric and whether anything regressed.
+    A metric regresses when one of the COMPARED statistics is more than tolerance (relative) slower than in the baseline,
+    or when its checksum doesn't match (the benchmark doesn't do the same work anymore), or when the scenario has failed.
+    """
+    lines = []
+    failed = False
+    for name, result in results.items():
+        problems = []
+        if not result["deterministic"]:
+            problems.append("nondeterministic")
+        problems.extend(result["errors"])
+        if (base := baseline.get(name)) is None:
+            lines.append((name, "new", problems))
+            failed |= bool(problems)
+            continue
+        if base["checksum"] is not None and result["checksum"] != base["checksum"]:
+            problems.append(f"checksum {result['checksum']} != {base['checksum']}")
+        changes = []
+        for stat in COMPARED:
+            change = result[stat] / base[stat] - 1 if base[stat] else 0
+            changes.append(f"{stat} {base[stat]:.3f} -> {result[stat]:.3f} ms ({change:+.0%})")
+            if change > tolerance:
+                problems.append(f"{stat} regressed by {change:.0%}")
+        lines.append((name, ", ".join(changes), problems))
+        failed |= bool(problems)
+    return lines, failed
+
+
+# B E N C H M A R K S
+SCENARIOS: dict[str, Scenario] = {}
@@ -0,0 +1,249 @@
+import tempfile
+import zlib
+import random
+import numpy as np
+from math import sin
+from pathlib import Path
+#
+from pyengine.pgbasics import *
+from pyengine import ecs
+#
+from src.engine import *
+from src.window import window, config
+from src.entities import Transform, Hitbox, Sprite, PhysicsSystem, RenderSystem, stash_entities
+from src.region import RegionStore
+from src import world as world_
+from src import terrain
+from src import menu
+from .bench import scenario, SEED
+
+
+# C O N S T A N T S
+AREA = [(x, y) for y in range(-2, 2) for x in range(-4, 4)]  # chunks of the benchmark world (the surface is at around y = 6)
+GRIDS = ("blocks", "bg", "walls", "light", "sky", "edits")   # chunk grids that a snapshot restores
+GENERATED_GRIDS = GRIDS[:-1]                                 # chunk grids that the generation fills in
+TORCH_SPACING = 6
+BLAST_CENTER = ((0, 1), (8, 20))                             # (chunk_index, block_pos) underground
+BLAST_RADIUS = 7
+FLY_FRAMES = 300
+FLY_SPEED = 12                                               # px per frame
+ENTITY_FRAMES = 60
+# the benchmark worlds are generated on the main thread with a fixed seed and are never autosaved.
+# the generation isn't cut off by the chunk budget either, otherwise how far the fly-through gets would depend on the machine
+WORLD_CONFIG = config["world"] | {"seed": SEED, "chunk_workers": 0, "chunk_budget": float("inf"), "autosave_interval": float("inf")}
+# saved chunks are written to a temporary directory, so nothing from a real save of the seed gets loaded
+SAVES = tempfile.TemporaryDirectory(prefix="blocks-benchmarks-")
+
+
+# F U N C T I O N S
+def new_world(area=AREA):
+    """
+    Returns a fresh world with the given chunks generated. The terrain cache is cleared, so the chunks are generated from scratch.
+    """
+    terrain.cached_chunk.cache_clear()
+    world = world_.World(menu, **WORLD_CONFIG)
+    world.regions = RegionStore(Path(SAVES.name, "regions"))
+    for chunk_index in area:
+        world.create_chunk(chunk_index)
+    world.flush_light()
+    return world
+
+
+def close_world(world):
+    # the entities live in the global ecs, so they would pile up over the worlds
+    for chunk_index in world.chunks:
+        stash_entities(chunk_index)
+    world.close()
+
+
+def checksum(world):
+    # crc of all grids of all chunks
+    crc = 0
+    for chunk_index in sorted(world.chunks):
+        chunk = world.chunks[chunk_index]
+        for grid in GRIDS:
+            crc = zlib.crc32(getattr(chunk, grid).tobytes(), crc)
+    return crc
+
+
+def generated(world, area=AREA):
+    # the generated grids of the chunks in the area, checked for being the same no matter the order they were generated in
+    return {chunk_index: [getattr(world.chunks[chunk_index], grid).copy() for grid in GENERATED_GRIDS] for chunk_index in area}
+
+
+def snapshot(world):
+    return {chunk_index: [getattr(chunk, grid).copy() for grid in GRIDS] for chunk_index, chunk in world.chunks.items()}
+
+
+def restore(world, snap):
+    # the layers are views over the grids, so they are written in place
+    for chunk_index, grids in snap.items():
+        chunk = world.chunks[chunk_index]
+        for grid, saved in zip(GRIDS, grids):
+            getattr(chunk, grid)[...] = saved
+        world.light_dirty.add(chunk_index)
+
+
+def torch_grid():
+    # (chunk_index, block_pos) of a torch every TORCH_SPACING blocks over the whole area
+    xs = range(min(x for x, _ in AREA) * CW + 3, (max(x for x, _ in AREA) + 1) * CW, TORCH_SPACING)
+    ys = range(min(y for _, y in AREA) * CH + 3, (max(y for _, y in AREA) + 1) * CH, TORCH_SPACING)
+    return [((x // CW, y // CH), (x, y)) for y in ys for x in xs]
+
+
+def spawn_entities(world, num):
+    # drops falling onto the terrain all over the area, moving sideways
+    chunks = []
+    for _ in range(num):
+        x = random.uniform(min(x for x, _ in AREA) * CW * BS, (max(x for x, _ in AREA) + 1) * CW * BS)
+        y = random.uniform(-CH * BS, 0)
+        chunk_index = world.pos_to_tile((x, y))[0]
+        ecs.create_entity(
+            Transform(Vec2(0, 0), Vec2(random.uniform(-1, 1), 0), gravity=0.03),
+            Hitbox((x, y), (0, 0), anchor="center"),
+            Sprite.from_block("soil", 0.5),
+            chunk=chunk_index
+        )
+        chunks.append(chunk_index)
+    return sorted(set(chunks))
+
+
+# M I C R O
+@scenario("micro", repeat=10)
+def generate_chunks(bench):
+    # all stages of len(AREA) chunks (and the partial stages of their neighbours)
+    for _ in range(bench.repeat):
+        world = new_world(area=())
+        with bench.measure():
+            for chunk_index in AREA:
+                world.create_chunk(chunk_index)
+            world.flush_light()
+        bench.check(checksum(world))
+        close_world(world)
+
+
+@scenario("micro", repeat=5)
+def generation_order(bench):
+    # the chunks of the area generated in a different (shuffled) order every time, which must not change what they end up like.
+    # a mismatch fails the results instead of stopping the run
+    expected = None
+    for i in range(bench.repeat):
+        order = AREA[:]
+        random.Random(i).shuffle(order)
+        world = new_world(area=())
+        with bench.measure():
+            for chunk_index in order:
+                world.create_chunk(chunk_index)
+            world.flush_light()
+        grids = generated(world)
+        if expected is None:
+            expected = grids
+        mismatches = [
+            (chunk_index, grid)
+            for chunk_index in AREA
+            for grid, array, expected_array in zip(GENERATED_GRIDS, grids[chunk_index], expected[chunk_index])
+            if not np.array_equal(array, expected_array)
+        ]
+        if mismatches:
+            chunk_index, grid = mismatches[0]
+            bench.fail(f"shuffled order {i} generated {len(mismatches)} different grids (e.g. {grid} of {chunk_index})")
+        bench.check(zlib.crc32(b"".join(array.tobytes() for chunk_index in AREA for array in grids[chunk_index])))
+        close_world(world)
+
+
+@scenario("micro", repeat=10)
+def torch_grid_light(bench):
+    # placing a grid of torches, each one propagating its light
+    world = new_world()
+    snap = snapshot(world)
+    torches = torch_grid()
+    for _ in range(bench.repeat):
+        restore(world, snap)
+        with bench.measure():
+            for chunk_index, block_pos in torches:
+                world.set(chunk_index, block_pos, "torch")
+            world.flush_light()
+        bench.check(checksum(world))
+    close_world(world)
+
+
+@scenario("micro", repeat=50)
+def torch(bench):
+    # placing a single torch underground and breaking it again
+    world = new_world()
+    snap = snapshot(world)
+    chunk_index, block_pos = BLAST_CENTER
+    for _ in range(bench.repeat):
+        restore(world, snap)
+        with bench.measure("place"):
+            world.set(chunk_index, block_pos, "torch")
+            world.flush_light()
+        with bench.measure("break"):
+            world.set(chunk_index, block_pos, "air")
+            world.flush_light()
+        bench.check(checksum(world))
+    close_world(world)
+
+
+@scenario("micro", repeat=20)
+def dynamite(bench):
+    # the blast of a dynamite, just like Player.interact does it (without the sleeps of its thread), and the light work it leaves
+    world = new_world()
+    snap = snapshot(world)
+    chunk_index, block_pos = BLAST_CENTER
+    for _ in range(bench.repeat):
+        restore(world, snap)
+        with bench.measure():
+            for xo, yo in world.get_radius_around(BLAST_RADIUS):
+                new_chunk_index, new_block_pos = world.correct_tile(chunk_index, block_pos, xo, yo)
+                if world.exists(new_chunk_index, new_block_pos):
+                    world.break_(new_chunk_index, new_block_pos)
+            world.flush_light()
+        bench.check(checksum(world))
+    close_world(world)
+
+
+# M A C R O
+@scenario("macro", repeat=FLY_FRAMES, warmup=10)
+def fly_through(bench):
+    # the camera flies over the surface (up and down a bit) through a world that gets generated, lit and rendered on the way
+    from src.game import Game  # opens the shader and the midblit, so only when needed
+    terrain.cached_chunk.cache_clear()
+    game = Game(config=config | {"world": WORLD_CONFIG})
+    game.world.regions = RegionStore(Path(SAVES.name, "regions"))
+    for frame in range(bench.repeat):
+        last_scroll = game.scroll
+        game.scroll = [frame * FLY_SPEED - window.width / 2, 200 * sin(frame / 40) - window.height / 2]
+        game.scroll_vel = [game.scroll[0] - last_scroll[0], game.scroll[1] - last_scroll[1]]
+        game.player.rect.center = (game.scroll[0] + window.width / 2, game.scroll[1] + window.height / 2)
+        with bench.measure():
+            pgb.fill_display(window.display, SKY_BLUE)
+            game.world.update(window.display, game.scroll, game, 1)
+    # how much light work the scheduler got through depends on the machine, but not what the light ends up like
+    game.world.flush_light()
+    bench.check(checksum(game.world))
+    close_world(game.world)
+
+
+def entities(num):
+    def entities_(bench):
+        # num entities falling and moving through the physics and the rendering
+        world = new_world()
+        chunks = spawn_entities(world, num)
+        physics_system = PhysicsSystem(window.display, world)
+        render_system = RenderSystem(window.display)
+        scroll = (-window.width / 2, -window.height / 2)
+        for _ in range(bench.repeat):
+            pgb.fill_display(window.display, SKY_BLUE)
+            with bench.measure("physics"):
+                physics_system.process(1, chunks=chunks)
+            with bench.measure("render"):
+                render_system.process(scroll, False, False, window, 1, chunks=chunks, last_positions=physics_system.last_positions, alpha=1)
+        bench.check(zlib.crc32(np.array([hitbox.center for _, _, (hitbox,) in ecs.get_components(Hitbox, chunks=chunks)]).tobytes()))
+        close_world(world)
+    entities_.__name__ = f"entities_{num // 1000}k"
+    return scenario("macro", repeat=ENTITY_FRAMES, warmup=5)(entities_)
+
+
+entities(1_000)
+entities(10_000)
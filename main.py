@@ -2,18 +2,36 @@ import cProfile
 import pstats
 import tomllib as toml
 from pathlib import Path
-#
-from src.game import Game
 
 
 def run(config):
+    # imported here so that chunk worker processes don't open a window when they import this module
+    from src.game import Game
     game = Game(config=config)
     game.mainloop()
 
 
+def sample(config):
+    # the sampler only imports the standard library, so it doesn't open a window in the chunk workers either
+    from src.sampler import Sampler
+    sampler = Sampler(config["game"]["sample_rate"])
+    sampler.start()
+    try:
+        run(config=config)
+    finally:
+        # the game quits with sys.exit
+        sampler.stop()
+        sampler.write(Path("logs", "out.folded"))
+        print(f"{sampler.num_samples} samples written to {Path('logs', 'out.folded')}")
+
+
 def profile(config):
     Path("logs").mkdir(exist_ok=True)
 
+    if config["game"]["profile_mode"] == "sampling":
+        sample(config)
+        return
+
     if config["game"]["profile_to_file"]:
         cProfile.run("run(config=config)", filename=Path("logs", "out.prof"))
     else:
@@ -3,6 +3,7 @@ from collections import defaultdict
 from functools import lru_cache
 import os
 import re
+import numpy as np
 #
 from pyengine.pgbasics import *
 import pyengine.pgbasics as pgb
@@ -173,6 +174,55 @@ class BF(IntFlag):
     FLOWER = WALKABLE
 
 
+class BlockRegistry:
+    """
+    Name <-> id palette for the array-backed chunk storage. Id 0 is reserved for "no block".
+    """
+    def __init__(self):
+        self.names: list[str | None] = [None]
+        self.ids: dict[str, int] = {}
+        self.tables: dict[str, np.ndarray] = {}
+    
+    def __len__(self):
+        return len(self.names)
+    
+    def id(self, name: str) -> int:
+        """
+        Returns the id of the given block name, registering it if it is new
+        """
+        try:
+            return self.ids[name]
+        except KeyError:
+            self.ids[name] = id_ = len(self.names)
+            self.names.append(name)
+            return id_
+    
+    def name(self, id_: int) -> str | None:
+        return self.names[id_]
+    
+    def lut(self, names) -> np.ndarray:
+        """
+        Returns an array that maps indices of the given names to block ids (None maps to 0)
+        """
+        return np.array([0 if name is None else self.id(name) for name in names], dtype=np.uint16)
+    
+    def table(self, key: str, func, dtype) -> np.ndarray:
+        """
+        Returns an array with func(name) for every block id (id 0 maps to 0), so it can be indexed with whole id grids.
+        The result is cached under the given key until new blocks get registered.
+        """
+        table = self.tables.get(key)
+        if table is None or len(table) != len(self.names):
+            table = self.tables[key] = np.array([0 if name is None else func(name) for name in self.names], dtype=dtype)
+        return table
+    
+    def mask(self, key: str, predicate) -> np.ndarray:
+        """
+        Same as table, but tells for every block id whether its name matches the predicate
+        """
+        return self.table(key, lambda name: bool(predicate(name)), bool)
+
+
 class OreData:
     def __init__(self):
         self.veins = {
@@ -195,8 +245,8 @@ flags = defaultdict(lambda: BF.NONE, {
     "rope": BF.WALKABLE,
     "karabiner": BF.WALKABLE,
     "workbench": BF.WALKABLE,
-    "air": BF.EMPTY | BF.WALKABLE | BF.LIGHT_SOURCE | BF.UNBREAKABLE,
-    "dirt_f" | X.b: BF.EMPTY | BF.LIGHT_SOURCE,
+    "air": BF.EMPTY | BF.WALKABLE | BF.UNBREAKABLE,
+    "dirt_f" | X.b: BF.EMPTY,
     "stone" | X.b: BF.EMPTY,
     "blackstone": BF.UNBREAKABLE,
     "torch": BF.LIGHT_SOURCE | BF.WALKABLE | BF.DECOR,
@@ -213,10 +263,9 @@ for block, flag in flags.items():
     if flag | BF.FOOD:
         flag |= BF.UNPLACABLE
 
+# sunlight isn't in here, it has its own light channel (see World.update_sky)
 params = {
-    "air": {"light": MAX_LIGHT},
     "torch": {"light": MAX_LIGHT, "light_falloff": 1},
-    "dirt_f" | X.b: {"light": MAX_LIGHT},
 }
 
 # B L O C K  G R O U P S
@@ -259,6 +308,12 @@ surf_images["diamond"] = swap_palette(surf_images["base-ore"], BLACK, (185, 242,
 for name, image in surf_images.copy().items():
     surf_images[name | X.b] = darken(surf_images[name], 0.7)
 
+# register every known block so ids are the same in every process
+registry = BlockRegistry()
+for name in surf_images:
+    if name:
+        registry.id(name)
+
 # potentially convert all blocks to textures
 images = {k: pgb.T(v) for k, v in surf_images.items()}
 
@@ -0,0 +1,196 @@
+import numpy as np
+from enum import IntEnum
+#
+from .engine import *
+from .blocks import registry
+
+
+# C L A S S E S
+class ChunkStage(IntEnum):
+    """
+    Generation stages of a chunk, in order. NOISE and TERRAIN run in the worker pool, the other ones on the main thread.
+    """
+    NONE = 0         # allocated, but nothing generated (e.g. it only holds light of its neighbours)
+    NOISE = 1
+    TERRAIN = 2
+    ORES = 3         # ore veins
+    DECORATIONS = 4  # poppies, rocks
+    STRUCTURES = 5   # trees
+    ENTITIES = 6     # mobs
+    FULL = 7         # lit and ready to be rendered
+
+
+# C O N S T A N T S
+# how far (in chunks, horizontally and vertically) the blocks placed by a stage can reach into other chunks.
+# a chunk only runs a stage when all chunks within this reach have finished the previous stage.
+STAGE_REACH = {
+    ChunkStage.ORES: (1, 1),
+    ChunkStage.DECORATIONS: (1, 1),
+    ChunkStage.STRUCTURES: (1, 2),  # trees are taller than a chunk
+}
+
+
+# L A Y E R S
+class BlockLayer:
+    """
+    Dict-like view over one block id grid of a chunk.
+    Keys are absolute block positions and values are block names, just like the old dict[Pos, str] layers.
+    """
+    __slots__ = ("grid", "ox", "oy")
+
+    def __init__(self, chunk_index, grid):
+        self.grid = grid
+        self.ox = chunk_index[0] * CW
+        self.oy = chunk_index[1] * CH
+
+    def _rel(self, block_pos):
+        rel_x, rel_y = block_pos[0] - self.ox, block_pos[1] - self.oy
+        if 0 <= rel_x < CW and 0 <= rel_y < CH:
+            return rel_y, rel_x
+        raise KeyError(block_pos)
+
+    def __getitem__(self, block_pos):
+        id_ = self.grid[self._rel(block_pos)]
+        if not id_:
+            raise KeyError(block_pos)
+        return registry.names[id_]
+
+    def __setitem__(self, block_pos, name):
+        self.grid[self._rel(block_pos)] = registry.id(name)
+
+    def __delitem__(self, block_pos):
+        rel = self._rel(block_pos)
+        if not self.grid[rel]:
+            raise KeyError(block_pos)
+        self.grid[rel] = 0
+
+    def __contains__(self, block_pos):
+        rel_x, rel_y = block_pos[0] - self.ox, block_pos[1] - self.oy
+        return 0 <= rel_x < CW and 0 <= rel_y < CH and self.grid[rel_y, rel_x] != 0
+
+    def __len__(self):
+        return int(np.count_nonzero(self.grid))
+
+    def __iter__(self):
+        for rel_y, rel_x in zip(*np.nonzero(self.grid)):
+            yield (self.ox + int(rel_x), self.oy + int(rel_y))
+
+    def get(self, block_pos, default=None):
+        rel_x, rel_y = block_pos[0] - self.ox, block_pos[1] - self.oy
+        if 0 <= rel_x < CW and 0 <= rel_y < CH:
+            id_ = self.grid[rel_y, rel_x]
+            if id_:
+                return registry.names[id_]
+        return default
+
+    def items(self):
+        names = registry.names
+        for rel_y, row in enumerate(self.grid.tolist()):
+            for rel_x, id_ in enumerate(row):
+                if id_:
+                    yield (self.ox + rel_x, self.oy + rel_y), names[id_]
+
+
+class LightLayer(BlockLayer):
+    """
+    Same view as BlockLayer, but over the light grid. Every position inside the chunk has a light value (0 by default).
+    """
+    __slots__ = ()
+
+    def __getitem__(self, block_pos):
+        return int(self.grid[self._rel(block_pos)])
+
+    def __setitem__(self, block_pos, light):
+        self.grid[self._rel(block_pos)] = light
+
+    def __delitem__(self, block_pos):
+        self.grid[self._rel(block_pos)] = 0
+
+    def __contains__(self, block_pos):
+        rel_x, rel_y = block_pos[0] - self.ox, block_pos[1] - self.oy
+        return 0 <= rel_x < CW and 0 <= rel_y < CH
+
+    def __len__(self):
+        return CW * CH
+
+    def __iter__(self):
+        for rel_y in range(CH):
+            for rel_x in range(CW):
+                yield (self.ox + rel_x, self.oy + rel_y)
+
+    def get(self, block_pos, default=None):
+        rel_x, rel_y = block_pos[0] - self.ox, block_pos[1] - self.oy
+        if 0 <= rel_x < CW and 0 <= rel_y < CH:
+            return int(self.grid[rel_y, rel_x])
+        return default
+
+    def items(self):
+        for rel_y, row in enumerate(self.grid.tolist()):
+            for rel_x, light in enumerate(row):
+                yield (self.ox + rel_x, self.oy + rel_y), light
+
+
+class Chunk:
+    """
+    Compact storage of a single chunk: one uint16 block id grid per layer and a uint8 grid per light channel, indexed by [rel_y, rel_x]
+    """
+    __slots__ = ("index", "blocks", "bg", "walls", "light", "sky", "sky_exit", "data", "bg_data", "wall_data", "lightmap", "stage", "terrain", "writes", "edits", "version", "saved_version")
+
+    def __init__(self, index):
+        self.index = index
+        # raw grids
+        self.blocks = np.zeros((CH, CW), dtype=np.uint16)
+        self.bg = np.zeros((CH, CW), dtype=np.uint16)
+        self.walls = np.zeros((CH, CW), dtype=np.uint16)
+        self.light = np.zeros((CH, CW), dtype=np.uint8)  # block light (torches)
+        self.sky = np.zeros((CH, CW), dtype=np.uint8)    # sky light, before it gets scaled by the daylight
+        self.sky_exit = None                              # columns in which sunlight leaves the chunk at the bottom
+        # dict-like views used by World.data, World.bg_data, etc.
+        self.data = BlockLayer(index, self.blocks)
+        self.bg_data = BlockLayer(index, self.bg)
+        self.wall_data = BlockLayer(index, self.walls)
+        self.lightmap = LightLayer(index, self.light)
+        # generation
+        self.stage = ChunkStage.NONE
+        self.terrain = None  # the bare foreground terrain (as indices into terrain.NAMES), which the stages of the neighbours read
+        self.writes: dict[ChunkStage, dict[Pos, tuple[np.ndarray, np.ndarray]]] = {}  # blocks placed by a stage as (cells, ids), grouped by target chunk
+        # edits after the generation (only these are saved, everything else is regenerated from the seed)
+        self.edits = np.zeros((CH, CW), dtype=bool)  # dirty bitset of the blocks that have been edited
+        self.version = 0                              # incremented on every edit
+        self.saved_version = 0                        # version of the last save
+
+    @property
+    def dirty(self):
+        return self.version != self.saved_version
+
+    def edit(self, block_pos):
+        self.edits[block_pos[1] - self.index[1] * CH, block_pos[0] - self.index[0] * CW] = True
+        self.version += 1
+
+    def pack(self, entities):
+        """
+        Returns the record that gets saved in the region files: the entities and the edited blocks of all layers
+        """
+        record = {"entities": entities, "version": self.version}
+        cells = np.flatnonzero(self.edits)
+        if cells.size:
+            # block ids only make sense in this process, so the names of the used ids are stored along with them
+            ids = np.stack([self.blocks.ravel()[cells], self.bg.ravel()[cells], self.walls.ravel()[cells]])
+            used, local = np.unique(ids, return_inverse=True)
+            record |= {
+                "cells": cells.astype(np.uint8),
+                "names": [registry.names[id_] for id_ in used.tolist()],
+                "ids": local.reshape(ids.shape).astype(np.uint16),
+            }
+        return record
+
+    def unpack(self, record):
+        # applies the edits of a record on top of the regenerated chunk
+        self.version = self.saved_version = record["version"]
+        if "cells" in record:
+            cells = record["cells"]
+            blocks, bg, walls = registry.lut(record["names"])[record["ids"]]
+            self.blocks.reshape(-1)[cells] = blocks
+            self.bg.reshape(-1)[cells] = bg
+            self.walls.reshape(-1)[cells] = walls
+            self.edits.reshape(-1)[cells] = True
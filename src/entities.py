@@ -14,6 +14,7 @@ from pyengine import ecs
 from pyengine import pgbasics as pgb
 #
 from . import fonts
+from . import text
 from . import blocks
 from .engine import *
 
@@ -22,6 +23,21 @@ del Window, Renderer, Texture, Image
 
 
 # functions
+def pack_surf(surf):
+    # surfaces can't be pickled
+    return pygame.image.tobytes(surf, "RGBA"), surf.get_size()
+
+
+def unpack_surf(state):
+    return pygame.image.frombytes(*state, "RGBA")
+
+
+def jump_rect(hitbox, tr):
+    # the area in front of a mob, which jumps when there are blocks in it
+    o = 20
+    return hitbox.inflate(o * 2, 0).move(o * sign(tr.vel.x), -5)
+
+
 # @lru_cache
 def tinysaurus():
     url = r"https://tiny.dinos.dev/?small=true&outline=false"
@@ -179,6 +195,7 @@ class Transform:
         self.def_vel = self.vel.copy()
         self.last_tile = None
         self.last_blocks_around = None
+        self.last_jump_blocks = None  # blocks in the jump range of a mob, only kept to draw them
         if any(self.sines):
             self.sine_offsets = [
                 randf(0, 2 * pi),
@@ -243,6 +260,13 @@ class Sprite:
         self.anim_speed = 0
         self.avel = 0
         self.animate = False
+        self.block = None
+        return self
+
+    @classmethod
+    def from_block(cls, name, scale=1):
+        self = cls.from_img(pgb.scale_by(blocks.surf_images[name], scale))
+        self.block = (name, scale)
         return self
 
     @classmethod
@@ -257,8 +281,32 @@ class Sprite:
         self.offset = 0
         self.anim_speed = 0.2
         self.animate = True
+        self.block = None
         return self
 
+    @property
+    def savable(self):
+        # images that only exist as textures can't be saved
+        return self.animate or self.block is not None or all(isinstance(img, pygame.Surface) for img in self.images + self.fimages)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.animate or self.block is not None:
+            # animated sprites get their images from AnimData every frame and block sprites are created again when loading
+            state["images"] = state["fimages"] = []
+        else:
+            state["images"] = [pack_surf(img) for img in self.images]
+            state["fimages"] = [pack_surf(img) for img in self.fimages]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.block is not None:
+            self.images = self.fimages = [pgb.scale_by(blocks.surf_images[self.block[0]], self.block[1])]
+        elif not self.animate:
+            self.images = [unpack_surf(img) for img in self.images]
+            self.fimages = [unpack_surf(img) for img in self.fimages]
+
 
 class Hitbox(pygame.FRect):
     def __init__(self, *args, anchor=None):
@@ -275,6 +323,12 @@ class DamageText:
         self.inited = False
         self.offset = None
 
+    def __getstate__(self):
+        return self.__dict__ | {"img": pack_surf(self.img)}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state | {"img": unpack_surf(state["img"])})
+
 
 @dataclass
 class Headbutter:
@@ -286,15 +340,53 @@ class Flinch: pass
 class Bee: pass
 
 class NoJump: pass
-    
+
+
+# every component type an entity can have (used to take entities out of the ecs and put them back later)
+COMPONENTS = (
+    Transform, Hitbox, Sprite, Mob, Health, Drop, Loot, Disappear, Projectile, PlayerFollower,
+    Rigidbody, DamageText, Headbutter, Flinch, Bee, NoJump, DebugFlag, CollisionFlag,
+)
+
+
+def is_savable(components):
+    return all(comp.savable for comp in components if isinstance(comp, Sprite))
+
+
+def get_entities(chunk):
+    """
+    Returns the components of every entity in the given chunk, keyed by the entity id
+    """
+    return {
+        ent_id: [comp for type_ in COMPONENTS if (comp := ecs.try_component(ent_id, type_)) is not None]
+        for ent_id, _, _ in ecs.get_components(Hitbox, chunks=[chunk])
+    }
+
+
+def stash_entities(chunk):
+    """
+    Removes all entities of the given chunk from the ecs and returns their components, so they can be recreated with restore_entities
+    """
+    entities = get_entities(chunk)
+    for ent_id in entities:
+        ecs.delete_entity(ent_id, chunk)
+    return list(entities.values())
+
+
+def restore_entities(stash, chunk):
+    for comps in stash:
+        ecs.create_entity(*comps, chunk=chunk)
+
 
 # SYSTEMS -----------------------------------------------------
 class PhysicsSystem(ecs.System):
     def __init__(self, display, world):
         self.display = display
         self.world = world
+        self.last_positions: dict[int, tuple[float, float]] = {}  # hitbox centers before the last tick, for the interpolation
             
-    def process(self, scroll, hitboxes, collisions, dt, chunks):
+    def process(self, dt, chunks):
+        self.last_positions = {}
         for ent_id, chunk, (tr, hitbox, sprite) in ecs.get_components(Transform, Hitbox, Sprite, chunks=chunks):
             # check if hitbox needs to be initialized by a Sprite
             # if hitbox.size == (0, 0):
@@ -306,6 +398,8 @@ class PhysicsSystem(ecs.System):
             #         hitbox.size = sprite.images[0].size
 
             if tr.active:
+                self.last_positions[ent_id] = hitbox.center
+
                 # range for block collisions
                 x_disp = ceil(abs(tr.vel.x / BS)) + ceil(hitbox.width / 2 / BS)
                 range_x = (-x_disp, x_disp)
@@ -334,9 +428,6 @@ class PhysicsSystem(ecs.System):
 
                 # access cached collision blocks
                 for rect in tr.last_blocks_around:
-                    if collisions:
-                        pgb.draw_rect(self.display, ORANGE, rect.move(-scroll[0], -scroll[1]), 1)
-                        
                     if hitbox.colliderect(rect):
                         if tr.vel.y > 0:
                             hitbox.bottom = rect.top
@@ -377,14 +468,9 @@ class PhysicsSystem(ecs.System):
                 y_disp_ext = ceil(abs(tr.vel.y / BS)) + ceil(hitbox.height / 2 / BS)
                 range_y_ext = (-y_disp_ext, y_disp_ext)
 
-                o = 20
-                extended_rect = hitbox.inflate(o * 2, 0).move(o * sign(tr.vel.x), -5)
-                if hitboxes:
-                    pgb.draw_rect(self.display, (120, 120, 120), extended_rect.move(-scroll[0], -scroll[1]), 1)
-                for rect in self.world.get_blocks_around(extended_rect, range_x=range_x_ext, range_y=range_y_ext):
-                    # draw the hitboxes
-                    if hitboxes:
-                        pgb.draw_rect(self.display, GREEN, rect.move(-scroll[0], -scroll[1]), 1)
+                extended_rect = jump_rect(hitbox, tr)
+                tr.last_jump_blocks = self.world.get_blocks_around(extended_rect, range_x=range_x_ext, range_y=range_y_ext)
+                for rect in tr.last_jump_blocks:
                     # jump the mob because it sees a block in front of it
                     if extended_rect.colliderect(rect):
                         tr.vel.y = -2
@@ -437,7 +523,7 @@ class RenderSystem(ecs.System):
     def __init__(self, display):
         self.display = display
             
-    def process(self, scroll, hitboxes, window, dt, chunks):
+    def process(self, scroll, hitboxes, collisions, window, dt, chunks, last_positions, alpha):
         num_rendered = 0
         blit_batch: tuple[pygame.Surface, pygame.Rect] = []
 
@@ -488,8 +574,11 @@ class RenderSystem(ecs.System):
                     sin(ticks() * m) * tr.sines[1],
                 ]
          
-            # scroll the hitbox to correct screen position
+            # scroll the hitbox to correct screen position (between the positions of the last two ticks if it moves)
             scrolled_hitbox = hitbox.move(-scroll[0], -scroll[1])
+            if (last_pos := last_positions.get(ent_id)) is not None:
+                scrolled_hitbox.centerx += (last_pos[0] - hitbox.centerx) * (1 - alpha)
+                scrolled_hitbox.centery += (last_pos[1] - hitbox.centery) * (1 - alpha)
 
             # weird ass profiler can't do math idek at this point vro
             blit_rect = sprite.images[int(sprite.anim)].get_rect(center=scrolled_hitbox.center).move(0, sprite.offset)
@@ -508,20 +597,34 @@ class RenderSystem(ecs.System):
             # if GPU, render immediately. If CPU, save batch and render later
             if window.gpu:
                 self.display.blit(image, pygame.Rect(blit_rect))
+                image.color = WHITE  # only textures have a color
             else:
                 blit_batch.append((image, blit_rect))
-            
-            image.color = WHITE
 
             # debugging
-            if hitboxes:
-                pgb.draw_circle(self.display, RED, scrolled_hitbox.topleft, 4)
+            if hitboxes or collisions:
+                self.draw_debug(tr, scrolled_hitbox, scroll, hitboxes, collisions)
         
         if not window.gpu:
             self.display.fblits(blit_batch)  # as per docs, fblits is faster than blits
         
         return num_rendered
 
+    def draw_debug(self, tr, scrolled_hitbox, scroll, hitboxes, collisions):
+        """
+        Draws the blocks that the physics of the last tick looked at. The ranges around the entity follow its interpolated position,
+        the blocks stay where they are.
+        """
+        if collisions and tr and tr.active and tr.last_blocks_around is not None:
+            for rect in tr.last_blocks_around:
+                pgb.draw_rect(self.display, ORANGE, rect.move(-scroll[0], -scroll[1]), 1)
+        if hitboxes:
+            pgb.draw_circle(self.display, RED, scrolled_hitbox.topleft, 4)
+            if tr and tr.last_jump_blocks is not None:
+                pgb.draw_rect(self.display, (120, 120, 120), jump_rect(scrolled_hitbox, tr), 1)
+                for rect in tr.last_jump_blocks:
+                    pgb.draw_rect(self.display, GREEN, rect.move(-scroll[0], -scroll[1]), 1)
+
 
 class PlayerFollowerSystem(ecs.System):
     def __init__(self, display, player):
@@ -550,7 +653,7 @@ class DebugSystem(ecs.System):
         for ent_id, chunk, (flags, tr, health) in ecs.get_components(DebugFlag, Transform, Health, chunks=chunks):
             blit_pos = (tr.pos.x - scroll[0], tr.pos.y - scroll[1])
             if flags & DebugFlags.SHOW_CHUNK:
-                pgb.write(self.display, "center", chunk, fonts.orbitron[20], BROWN, blit_pos[0], blit_pos[1] - 20)
+                text.write(self.display, "center", chunk, fonts.orbitron[20], BROWN, blit_pos[0], blit_pos[1] - 20)
 
 
 class CollisionSystem(ecs.System):
@@ -627,19 +730,15 @@ class DropSystem(ecs.System):
                 ecs.delete_entity(ent_id, chunk)
 
 
-class HealthDisplaySystem(ecs.System):
-    def __init__(self, display):
-        self.display = display
-            
-    def process(self, scroll, chunks):
-        for ent_id, chunk, (hitbox, sprite, health) in ecs.get_components(Hitbox, Sprite, Health, chunks=chunks):
+class HealthSystem(ecs.System):
+    def process(self, chunks):
+        for ent_id, chunk, (hitbox, health) in ecs.get_components(Hitbox, Health, chunks=chunks):
             # check if the mob is dead (for dropping loot)
             if health <= 0:
                 # drop the loot if any
                 if (loot := ecs.try_component(ent_id, Loot)):
                     # drop all loot blocks
                     for block, amount in loot.data.items():
-                        drop_img = pgb.scale_by(blocks.surf_images[block], 0.5)
                         for _ in range(amount):
                             ecs.create_entity(
                                 Transform(
@@ -649,7 +748,7 @@ class HealthDisplaySystem(ecs.System):
                                     flag=TransformFlag(TransformFlags.BLOCK_HALT),
                                 ),
                                 Hitbox(hitbox.center, (0, 0), anchor="center"),
-                                Sprite.from_img(drop_img),
+                                Sprite.from_block(block, 0.5),
                                 Drop(block),
                                 Disappear.default(),
                                 chunk=chunk
@@ -657,14 +756,28 @@ class HealthDisplaySystem(ecs.System):
                 # delete as last
                 ecs.delete_entity(ent_id, chunk)
 
+            # decrease health bar visual using lerp
+            elif health.value < health.max:
+                health.trail -= (health.trail - health.value) * 0.01
+
+
+class HealthDisplaySystem(ecs.System):
+    def __init__(self, display):
+        self.display = display
+            
+    def process(self, scroll, chunks, last_positions, alpha):
+        for ent_id, chunk, (hitbox, sprite, health) in ecs.get_components(Hitbox, Sprite, Health, chunks=chunks):
             # render the health bar
             if 0 < health.value < health.max:
-                # decrease health bar visual using lerp
-                health.trail -= (health.trail - health.value) * 0.01
+                # above the interpolated position, just like the sprite
+                centerx, y = hitbox.centerx, hitbox.y
+                if (last_pos := last_positions.get(ent_id)) is not None:
+                    centerx += (last_pos[0] - hitbox.centerx) * (1 - alpha)
+                    y += (last_pos[1] - hitbox.centery) * (1 - alpha)
 
                 # display the health bar
                 bg_rect = pygame.Rect(0, 0, 60, 8)
-                bg_rect.midtop = (hitbox.centerx - scroll[0], hitbox.y - 20 - scroll[1])
+                bg_rect.midtop = (centerx - scroll[0], y - 20 - scroll[1])
                 # pgb.fill_rect(self.display, WHITE, bg_rect)
                 pgb.draw_rect(self.display, BLACK, bg_rect)
                 hl_rect = bg_rect.inflate(-4, -4)
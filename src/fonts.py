@@ -2,7 +2,25 @@ from pathlib import Path
 import pygame
 
 
-orbitron = [
-    pygame.font.Font(Path("res", "fonts", "orbitron", "static", "orbitron-regular.ttf"), i)
-    for i in range(1, 101)
-]
\ No newline at end of file
+class Face:
+    """
+    A font face by size, where every size is only loaded the first time it's used.
+    Indices are the same as in the list of sizes 1 to 100 that this used to be, so face[n] has size n + 1.
+    """
+    def __init__(self, *path):
+        self.path = Path("res", "fonts", *path)
+        self.sizes: dict[int, pygame.font.Font] = {}
+
+    def __getitem__(self, index):
+        try:
+            return self.sizes[index]
+        except KeyError:
+            self.sizes[index] = font = pygame.font.Font(self.path, index + 1)
+            return font
+
+
+orbitron = Face("orbitron", "static", "orbitron-regular.ttf")
+exo2 = Face("exo2", "exo2-regular.ttf")
+audiowide = Face("audiowide", "audiowide-regular.ttf")
+electrolize = Face("electrolize", "electrolize-regular.ttf")
+neuropolx = Face("neuropolx", "neuropol x rg.ttf")
@@ -1,5 +1,6 @@
 import pygame
 from pathlib import Path
+from collections import deque
 import sys
 #
 from pyengine.pgshaders import *
@@ -10,9 +11,11 @@ from src.window import *
 from src.entities import *
 from src.tools import *
 from src.midblit import Midblit
+from src.profiler import profiler
 from src import world
 from src import player
 from src import fonts
+from src import text
 from src import joystick
 from src import menu
 
@@ -23,7 +26,7 @@ class Game:
         self.config = config
         # rendering and frames
         self.clock = pygame.time.Clock()
-        if not window.gpu:
+        if not window.gpu and not window.headless:
             self.shader = ModernglShader(
                 Path("src", "shaders", "default.vert"),
                 Path("src", "shaders", "default.frag")
@@ -33,6 +36,8 @@ class Game:
         self.world = world.World(menu, **self.config["world"])
         self.player = player.Player(self, self.world, menu)
         self.fake_scroll = [0, 0]
+        self.last_fake_scroll = [0, 0]
+        self.scroll_vel = [0, 0]
         self.state = States.PLAY
         self.substate = Substates.PLAY
         # statistics
@@ -43,15 +48,35 @@ class Game:
         self.num_rendered_entities = 0
         self.num_frames = 0
         self.dt = 1
-        self.frame_graph = []
+        self.frame_graph = deque(maxlen=110)
+        # fixed timestep simulation
+        self.tick_rate = self.config["game"]["tick_rate"]  # simulation ticks per second
+        self.max_ticks = self.config["game"]["max_ticks"]  # per frame, when the game can't keep up the simulation slows down instead
+        self.tick_dt = 165 / self.tick_rate                # dt of a single tick (normalized like dt)
+        self.accumulator = 0                               # time (in ms) that hasn't been simulated yet
+        self.alpha = 1                                     # how far the rendered frame is between the last two ticks
+        self.processed_chunks = []
+        # per phase frame timings
+        profiler.resize(self.config["game"]["frame_history"])
         # joystick
         self.joystick = joystick.JoystickManager()
         # UI / UX
         self.sword = get_rock((120, 120, 120))
         # self.sword = get_axe((120, 120, 120))
         self.midblit = Midblit(self, window)
+        # lines of the HUD (only rendered again when they change)
+        self.hud = {
+            "fps": text.Label("topleft", fonts.orbitron[20], 5, 5),
+            "params": text.Label("topleft", fonts.orbitron[12], 5, 30),
+            "blocks": text.Label("topleft", fonts.orbitron[15], 5, 140),
+            "entities": text.Label("topleft", fonts.orbitron[15], 5, 160),
+            "state": text.Label("topleft", fonts.orbitron[15], 5, 180),
+            "substate": text.Label("topleft", fonts.orbitron[15], 5, 200),
+            "texture uploads": text.Label("topleft", fonts.orbitron[15], 5, 220),
+        }
         # menu stuff
         menu.quit.command = self.quit
+        menu.export_trace.command = self.export_trace
         # systems
         self.init_systems()
     
@@ -70,22 +95,49 @@ class Game:
         self.render_system = RenderSystem(window.display)
 
         # uniform systems without priority
-        ecs.add_systems(
+        ecs.add_systems(*map(profiler.instrument, (
             PlayerFollowerSystem(window.display, self.player),
             MobSystem(),
             CollisionSystem(self.player),
             DropSystem(window.display, self.player),
             DisappearSystem(),
             BeeSystem(self.player),
-        )
+            HealthSystem(),
+        )))
     
     def process_systems(self, processed_chunks):
-        # Render system gets processed at world.py
-        self.chunk_repositioning_system.process(chunks=processed_chunks)
-        self.physics_system            .process(self.scroll, menu.hitboxes, menu.collisions, self.dt, chunks=processed_chunks)
-        self.health_display_system     .process(self.scroll, chunks=processed_chunks)
+        # Render system gets processed at world.py, the health display every frame in the mainloop (both at the interpolated positions)
+        with profiler.scope("ChunkRepositioningSystem"):
+            self.chunk_repositioning_system.process(chunks=processed_chunks)
+        with profiler.scope("PhysicsSystem"):
+            self.physics_system            .process(self.tick_dt, chunks=processed_chunks)
         
         ecs.process_systems(chunks=processed_chunks)
+
+    def tick(self):
+        # a single step of the simulation, always with the same dt
+        with profiler.scope("player"):
+            self.player.move(self.tick_dt)
+        self.apply_scroll(1 - 0.9 ** self.tick_dt)  # the same smoothing as 0.1 per tick at 165 ticks per second
+        self.process_systems(self.processed_chunks)
+
+    def simulate(self):
+        """
+        Runs as many ticks as fit in the time that has passed since the last frame. The time that is left is carried over
+        to the next frame and tells how far the rendering has to interpolate between the last two ticks.
+        At most max_ticks run per frame: when the game can't keep up, the rest is dropped.
+        """
+        tick_time = 1000 / self.tick_rate
+        num_ticks = 0
+        while self.accumulator >= tick_time:
+            if num_ticks == self.max_ticks:
+                self.accumulator %= tick_time
+                break
+            with profiler.scope("tick"):
+                self.tick()
+            self.accumulator -= tick_time
+            num_ticks += 1
+        self.alpha = self.accumulator / tick_time
     
     def send_data_to_shader(self):
         # send textures to the shader
@@ -113,14 +165,25 @@ class Game:
 
         self.shader.send("grayscale", self.substate == Substates.MENU)
 
+    def export_trace(self):
+        path = Path("logs", "trace.json")
+        profiler.export_chrome_trace(path)
+        print(Fore.GREEN + f"Wrote the last {len(profiler.frames)} frames to {path}")
+
     def apply_scroll(self, m):
+        self.last_fake_scroll = last_scroll = self.fake_scroll.copy()
         self.fake_scroll[0] += (self.player.rect.x - self.fake_scroll[0] - window.width / 2 + self.player.rect.width / 2) * m
         self.fake_scroll[1] += (self.player.rect.y - self.fake_scroll[1] - window.height / 2 + self.player.rect.height / 2) * m
-        self.scroll[0] = int(self.fake_scroll[0])
-        self.scroll[1] = int(self.fake_scroll[1])
+        self.scroll_vel = [self.fake_scroll[0] - last_scroll[0], self.fake_scroll[1] - last_scroll[1]]
+
+    def interpolate_scroll(self):
+        # the camera is rendered between its positions of the last two ticks
+        self.scroll[0] = int(self.last_fake_scroll[0] + (self.fake_scroll[0] - self.last_fake_scroll[0]) * self.alpha)
+        self.scroll[1] = int(self.last_fake_scroll[1] + (self.fake_scroll[1] - self.last_fake_scroll[1]) * self.alpha)
     
     def quit(self, timer_msg=False):
         self.world.save()
+        self.world.close()
         elapsed = ticks() - self.last_start
         if timer_msg:
             print(Fore.GREEN
@@ -136,10 +199,12 @@ Runtime:
     def mainloop(self):
         self.running = True
         while self.running:
+            profiler.begin_frame()
             self.last_frame = ticks()
             self.num_frames += 1
             window.fps_cap = menu.fps_cap.value
 
+            profiler.begin("events")
             for event in pygame.event.get():
                 pgw.process_widget_events(event)
                 self.midblit.process_event(event)
@@ -168,33 +233,44 @@ Runtime:
                 
                 elif event.type == pygame.MOUSEBUTTONDOWN:
                     pass
+            profiler.end()
 
             pgb.fill_display(window.display, SKY_BLUE)
 
             # scroll the display
-            self.apply_scroll(0.1)
+            self.interpolate_scroll()
 
             # -------- P L A Y ---------------------------
             num_blocks = 0
             if self.state == States.PLAY:
                 # draw and update the terrain
                 self.num_rendered_entities = 0
-                num_blocks, processed_chunks, block_rects = self.world.update(window.display, self.scroll, self, self.dt)
-                
-                # process the ECS systems
-                self.process_systems(processed_chunks)
+                with profiler.scope("world"):
+                    num_blocks, processed_chunks = self.world.update(window.display, self.scroll, self, self.dt)
+                self.processed_chunks = processed_chunks
+                with profiler.scope("health"):
+                    self.health_display_system.process(self.scroll, chunks=processed_chunks, last_positions=self.physics_system.last_positions, alpha=self.alpha)
 
+                # run the simulation (including the ECS systems) in fixed ticks
+                with profiler.scope("simulate"):
+                    self.simulate()
+
+                profiler.begin("ui")
                 # inventory
                 self.player.inventory.update(window.display)
 
                 # midblit
                 self.midblit.update()
+                profiler.end()
 
             # update the pyengine.pgwidgets
-            pgw.draw_and_update_widgets()
+            with profiler.scope("widgets"):
+                pgw.draw_and_update_widgets()
+
+            profiler.begin("hud")
 
             # display the fps
-            pgb.write(window.display, "topleft", f"FPS : {int(self.clock.get_fps())}", fonts.orbitron[20], self.stat_color, 5, 5)
+            self.hud["fps"].draw(window.display, f"FPS : {int(self.clock.get_fps())}", self.stat_color)
 
             # display important parameters
             params = "params:\n"
@@ -210,44 +286,56 @@ Runtime:
                 params += f"{EMD} {"no lighting"}\n"
             params = params.removesuffix("\n")
             if params:
-                pgb.write(window.display, "topleft", params, fonts.orbitron[12], self.stat_color, 5, 30)
+                self.hud["params"].draw(window.display, params, self.stat_color)
 
             # display debugging / performance stats
-            pgb.write(window.display, "topleft", f"blocks : {num_blocks} ({self.world.num_hor_chunks} x {self.world.num_ver_chunks} chunks)", fonts.orbitron[15], self.stat_color, 5, 140)
-            pgb.write(window.display, "topleft", f"entities : {self.num_rendered_entities}", fonts.orbitron[15], self.stat_color, 5, 160)
-            pgb.write(window.display, "topleft", f"State: {self.state}", fonts.orbitron[15], self.stat_color, 5, 180)
-            pgb.write(window.display, "topleft", f"Substate: {self.substate}", fonts.orbitron[15], self.stat_color, 5, 200)
+            self.hud["blocks"].draw(window.display, f"blocks : {num_blocks} ({self.world.num_hor_chunks} x {self.world.num_ver_chunks} chunks)", self.stat_color)
+            self.hud["entities"].draw(window.display, f"entities : {self.num_rendered_entities}", self.stat_color)
+            self.hud["state"].draw(window.display, f"State: {self.state}", self.stat_color)
+            self.hud["substate"].draw(window.display, f"Substate: {self.substate}", self.stat_color)
+            self.hud["texture uploads"].draw(window.display, f"texture uploads : {self.world.texture_uploads}", self.stat_color)
 
-            self.frame_graph.insert(0, int(self.clock.get_fps()))
+            self.frame_graph.appendleft(int(self.clock.get_fps()))
             for i, fps in enumerate(self.frame_graph):
                 pgb.draw_rect(window.display, ORANGE, (240 - i, 55 - fps / 165 * 40, 1, 1))
-                self.frame_graph = self.frame_graph[:110]
+
+            # stacked bars of the phases of the last frames
+            if menu.profiler.checked:
+                profiler.draw(window.display, menu.fps_cap.value, 5, window.height - 5)
+            profiler.end()
 
             # --- DO ALL RENDERING BEFORE THIS CODE BELOW ---
-            if not window.gpu:
+            if not window.gpu and not window.headless:
                 # send relevant uniform data to the shader
-                self.send_data_to_shader()
+                with profiler.scope("shader"):
+                    self.send_data_to_shader()
 
-                # render the shader
-                self.shader.render()
+                    # render the shader
+                    self.shader.render()
 
-            # refreshes the window so you can see it
-            if window.gpu:
-                window.display.present()
-            else:
-                pygame.display.flip()
+            # refreshes the window so you can see it (there's nothing to see when headless)
+            with profiler.scope("present"):
+                if window.gpu:
+                    window.display.present()
+                elif not window.headless:
+                    pygame.display.flip()
 
             # you shant guess what this function does
-            if not window.gpu:
-                self.shader.release_all_textures()
+            if not window.gpu and not window.headless:
+                with profiler.scope("shader"):
+                    self.shader.release_all_textures()
 
             # debug quit
             if ticks() - self.last_start >= self.config["game"].get("timer", float("inf")):
                 self.quit(timer_msg=True)
             
             # process frame data and cap FPS
-            self.dt = self.clock.tick() / (1 / 165 * 1000) # normalized dt; 1 when perfectly stable
+            with profiler.scope("idle"):
+                frame_time = self.clock.tick()
+            self.accumulator += frame_time
+            self.dt = frame_time / (1 / 165 * 1000) # normalized dt; 1 when perfectly stable (only used for animations)
             if self.dt > 10:
                 self.dt = 10
+            profiler.end_frame()
 
         self.quit()
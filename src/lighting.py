@@ -0,0 +1,109 @@
+import numpy as np
+from collections import deque
+#
+from .engine import *
+from .blocks import registry, params, bwand, BF, MAX_LIGHT
+
+
+# C O N S T A N T S
+# alpha of the darkening overlay for every light value
+ALPHA = np.array([(MAX_LIGHT - 1 - min(light, MAX_LIGHT - 1)) / (MAX_LIGHT - 1) * 255 for light in range(256)]).astype(np.uint8)
+
+
+# F U N C T I O N S
+def emission(ids):
+    """
+    Returns the light that every block of the given id grid emits (0 for blocks that aren't light sources)
+    """
+    return registry.table("light", lambda name: params.get(name, {}).get("light", 0) if bwand(name, BF.LIGHT_SOURCE) else 0, np.uint8)[ids]
+
+
+def flood(light):
+    """
+    Spreads the light of a grid in place, so every cell ends up with at least the light of its brightest neighbour minus 1.
+    The grid can be anything from a single chunk to a whole neighbourhood of chunks.
+    Every step spreads the light by one cell in all directions at once, so it takes at most MAX_LIGHT steps.
+    """
+    grid = light.astype(np.int16)
+    for _ in range(MAX_LIGHT):
+        spread = grid.copy()
+        np.maximum(spread[1:], grid[:-1] - 1, out=spread[1:])
+        np.maximum(spread[:-1], grid[1:] - 1, out=spread[:-1])
+        np.maximum(spread[:, 1:], grid[:, :-1] - 1, out=spread[:, 1:])
+        np.maximum(spread[:, :-1], grid[:, 1:] - 1, out=spread[:, :-1])
+        if np.array_equal(spread, grid):
+            break
+        grid = spread
+    light[...] = grid
+    return light
+
+
+def remove(light, emission, y, x):
+    """
+    Removes the light of the source at (y, x) from the grid in place with two queues: the first one darkens every cell that got
+    its light from the source, the second one fills the dark area again from its brighter border and from the light sources in it.
+    Only the affected area is visited. emission is the light every cell of the grid emits after the source has been removed.
+    """
+    height, width = light.shape
+    grid = light.tolist()
+    offsets = ((1, 0), (0, 1), (-1, 0), (0, -1))
+
+    # darken
+    dark = deque([(y, x, grid[y][x])])
+    refill = deque()
+    grid[y][x] = 0
+    while dark:
+        y, x, value = dark.popleft()
+        if (source := int(emission[y, x])):
+            # other light sources in the dark area shine again
+            grid[y][x] = source
+            refill.append((y, x))
+        for yo, xo in offsets:
+            ny, nx = y + yo, x + xo
+            if 0 <= ny < height and 0 <= nx < width and (nei_value := grid[ny][nx]):
+                if nei_value < value:
+                    grid[ny][nx] = 0
+                    dark.append((ny, nx, nei_value))
+                else:
+                    # lit by something else
+                    refill.append((ny, nx))
+
+    # refill
+    while refill:
+        y, x = refill.popleft()
+        new_value = grid[y][x] - 1
+        for yo, xo in offsets:
+            ny, nx = y + yo, x + xo
+            if 0 <= ny < height and 0 <= nx < width and grid[ny][nx] < new_value:
+                grid[ny][nx] = new_value
+                refill.append((ny, nx))
+
+    light[...] = grid
+    return light
+
+
+def transparency(ids):
+    """
+    Returns which blocks of the given id grid let sunlight through
+    """
+    return registry.mask("sky", lambda name: bwand(name, BF.EMPTY))[ids]
+
+
+def sunlight(transparent, exposed):
+    """
+    Returns which cells of a chunk the sun shines on straight down: the cells above the first opaque block of every column
+    that sunlight enters from above. Also returns in which columns the sunlight leaves the chunk at the bottom.
+    """
+    sunlit = ~np.logical_or.accumulate(~transparent, axis=0) & exposed
+    return sunlit, sunlit[-1]
+
+
+def shade_surface(light):
+    """
+    Returns the darkening overlay of a chunk with the given light, built from a single RGBA buffer of one pixel per block
+    and scaled up to the size of the chunk
+    """
+    pixels = np.zeros((CH, CW, 4), dtype=np.uint8)
+    pixels[..., 3] = ALPHA[light]
+    small = pygame.image.frombytes(pixels.tobytes(), (CW, CH), "RGBA")
+    return pygame.transform.scale(small, (CW * BS, CH * BS))
@@ -27,12 +27,14 @@ widgets = {
         pgw.Checkbox(window.display, "Palettize", checked=False, **kwargs),
         pgw.Checkbox(window.display, "Lighting", checked=True, **kwargs),
         pgw.Checkbox(window.display, "Debug lighting", checked=False, **kwargs),
+        pgw.Checkbox(window.display, "Profiler", checked=False, **kwargs),
     ]),
     "sliders": SmartList([
         pgw.Slider(window.display, "FPS Cap", [10, 30, 60, 144, 165, float("inf")], 4, **kwargs | slider_kwargs),
     ]),
     "buttons": SmartList([
         pgw.Button(window.display, "Quit", lambda: None, pos=(300, 396), **kwargs | button_kwargs),
+        pgw.Button(window.display, "Export Trace", lambda: None, **kwargs | button_kwargs),
     ])
 }
 
@@ -43,8 +45,10 @@ chunk_borders = widgets["checkboxes"].find(lambda x: x.text == "Chunk Borders")
 palettize = widgets["checkboxes"].find(lambda x: x.text == "Palettize")
 lighting = widgets["checkboxes"].find(lambda x: x.text == "Lighting")
 debug_lighting = widgets["checkboxes"].find(lambda x: x.text == "Debug lighting")
+profiler = widgets["checkboxes"].find(lambda x: x.text == "Profiler")
 fps_cap = widgets["sliders"].find(lambda x: x.text == "FPS Cap")
 quit = widgets["buttons"].find(lambda x: x.text == "Quit")
+export_trace = widgets["buttons"].find(lambda x: x.text == "Export Trace")
 
 # organizing the widgets into neat grids
 num_types = len(widgets.values())
@@ -3,6 +3,7 @@ from pyengine.pgbasics import *
 from .engine import *
 from .window import *
 from . import fonts
+from . import text
 
 
 # M I D B L I T  A S S E T S
@@ -69,7 +70,7 @@ class Midblit:
         # sword
         if self.mode == MBT.FORGE_TABLE:
             self.game.sword.update()
-            pgb.write(self.display, "center", f"{self.game.sword.num_vertices} vertices", fonts.orbitron[14], BLACK, *self.window.center)
+            text.write(self.display, "center", f"{self.game.sword.num_vertices} vertices", fonts.orbitron[14], BLACK, *self.window.center)
     
     def update(self):
         if self.active:
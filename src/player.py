@@ -9,6 +9,7 @@ from .window import window
 from .blocks import BF, inventory_img, bwand, nbwand, X
 from .midblit import MBT
 from .tools import *
+from . import text
 
 
 class Direction(Enum):
@@ -43,6 +44,7 @@ class Inventory:
         self.keys: SmartList[str] = SmartList([None] * self.max_items)
         self.values: SmartList[int] = SmartList([None] * self.max_items)
         self.index: int = 0
+        self.name_label = text.Label("midtop", fonts.orbitron[16], window.width / 2, 70)
     
     def __getitem__(self, key):
         return self.keys[key]
@@ -95,7 +97,7 @@ class Inventory:
             display.blit(blocks.images[name], rects[-1])
 
             # write the block amount
-            pgb.write(display, "center", amount, fonts.orbitron[13], WHITE, blit_pos[0] + BS / 2, blit_pos[1] + BS / 2)
+            text.write(display, "center", amount, fonts.orbitron[13], WHITE, blit_pos[0] + BS / 2, blit_pos[1] + BS / 2)
 
             # only applicable to selected block
             if i == self.index:
@@ -104,7 +106,7 @@ class Inventory:
                     pgb.draw_rect(display, WHITE, (blit_pos[0] - S, blit_pos[1] - S, BS + S * 2, BS + S * 2), S)
 
                 # display the name with text
-                pgb.write(display, "midtop", blocks.repr(name), fonts.orbitron[16], self.game.stat_color, window.width / 2, 70)
+                self.name_label.draw(display, blocks.repr(name), self.game.stat_color)
 
 
 class Player:
@@ -120,12 +122,14 @@ class Player:
         # image, rectangle, hitbox, whatever
         self.images = AnimData.get(self.anim_skin, self.anim_mode)
         self.rect = pygame.FRect((0, -100, 52, 70))
+        self.last_pos = self.rect.topleft  # position before the last tick
         self.blit_rect = pygame.Rect(0, 0, 0, 0)
         # physics
         self.yvel = 0
         self.xvel = 0
         self.gravity = glob.gravity
         self.move_mode = MoveMode.NORMAL
+        self.direc = Direction.NONE
         # keyboard input
         self.jumps_left = 2
         self.pressing_jump = False
@@ -139,8 +143,13 @@ class Player:
         self.inventory.add("dynamite", 99)
         self.last_placed = []
     
+    @property
+    def vel(self):
+        # xvel keeps its last value when standing still, so it only counts while moving
+        return (self.xvel if self.direc != Direction.NONE else 0, self.yvel)
+    
     def update(self, display, dt):
-        self.move(dt)
+        # the movement happens in the ticks of the game
         self.edit(display)
         self.draw(display, dt)
     
@@ -166,8 +175,11 @@ class Player:
         else:
             image = self.fimages[int(self.anim_index)]
         
-        # render the player
+        # render the player (between the positions of the last two ticks)
+        alpha = self.game.alpha
         self.scrolled_rect = self.rect.move(-self.game.scroll[0], -self.game.scroll[1])
+        self.scrolled_rect.x += (self.last_pos[0] - self.rect.x) * (1 - alpha)
+        self.scrolled_rect.y += (self.last_pos[1] - self.rect.y) * (1 - alpha)
         self.blit_rect = self.images[int(self.anim_index)].get_rect(center=self.scrolled_rect.center).move(0, offset)
         display.blit(image, self.blit_rect)
         
@@ -372,6 +384,7 @@ class Player:
     def move(self, dt):
         # init
         keys = pygame.key.get_pressed()
+        self.last_pos = self.rect.topleft
         
         # movement X
         self.max_xvel = 2.1
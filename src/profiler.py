@@ -0,0 +1,161 @@
+import json
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import field
+#
+from .engine import *
+from .window import *
+from . import fonts
+from . import text
+
+
+# C O N S T A N T S
+OVERLAY_FRAMES = 120             # frames shown in the overlay, one bar each
+OVERLAY_BAR_WIDTH = 2            # px
+OVERLAY_HEIGHT = 120             # px
+OVERLAY_SCALE = 4                # px per ms
+LEGEND_LINE = 14                 # px
+OTHER_COLOR = (90, 90, 90)       # time of the frame that isn't in any phase
+PHASE_COLORS = [
+    (230, 25, 75), (60, 180, 75), (255, 225, 25), (0, 130, 200), (245, 130, 48), (145, 30, 180),
+    (70, 240, 240), (240, 50, 230), (210, 245, 60), (250, 190, 212), (0, 128, 128), (170, 110, 40),
+]
+
+
+# C L A S S E S
+@dataclass
+class Span:
+    name: str
+    depth: int    # 0 for the phases of the frame, more for the ones nested in them
+    start: float  # perf_counter() in seconds
+    end: float
+
+
+@dataclass
+class Frame:
+    start: float
+    end: float = 0
+    spans: list[Span] = field(default_factory=list)
+
+    def phase_times(self):
+        # time (in ms) spent in every top level phase, summed up if the phase ran more than once (e.g. the ticks)
+        times = {}
+        for span in self.spans:
+            if span.depth == 0:
+                times[span.name] = times.get(span.name, 0) + (span.end - span.start) * 1000
+        return times
+
+
+class FrameProfiler:
+    """
+    Scoped timers around the phases of a frame, kept for the last num_frames frames.
+    Phases can be nested. Nothing is recorded outside of begin_frame and end_frame (e.g. when the world is updated by the benchmarks),
+    or when num_frames is 0.
+    """
+    def __init__(self, num_frames=300):
+        self.frames: deque[Frame] = deque(maxlen=num_frames)
+        self.frame: Frame | None = None             # the frame that is being recorded
+        self.stack: list[tuple[str, float]] = []    # phases that have begun, but not ended yet
+        self.colors: dict[str, tuple] = {}          # of the phases in the overlay, in the order they first showed up
+        self.origin = time.perf_counter()           # timestamps in the trace are relative to this
+
+    def resize(self, num_frames):
+        self.frames = deque(self.frames, maxlen=num_frames)
+
+    def begin_frame(self):
+        if self.frames.maxlen:
+            self.frame = Frame(time.perf_counter())
+            self.stack.clear()
+
+    def end_frame(self):
+        if self.frame is not None:
+            self.frame.end = time.perf_counter()
+            self.frames.append(self.frame)
+            self.frame = None
+
+    def begin(self, name):
+        if self.frame is not None:
+            self.stack.append((name, time.perf_counter()))
+
+    def end(self):
+        # ends the phase that began last
+        if self.frame is not None and self.stack:
+            name, start = self.stack.pop()
+            self.frame.spans.append(Span(name, len(self.stack), start, time.perf_counter()))
+
+    @contextmanager
+    def scope(self, name):
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end()
+
+    def wrap(self, name, func):
+        # func, but timed as a phase every time it's called
+        def wrapper(*args, **kwargs):
+            with self.scope(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def instrument(self, system):
+        # times the process method of an ecs system under the name of its class
+        system.process = self.wrap(type(system).__name__, system.process)
+        return system
+
+    def export_chrome_trace(self, path):
+        """
+        Writes the recorded frames in the Chrome trace event format, which can be opened in Perfetto or chrome://tracing
+        """
+        def event(name, start, end):
+            return {"name": name, "ph": "X", "ts": (start - self.origin) * 1e6, "dur": (end - start) * 1e6, "pid": 1, "tid": 1}
+
+        events = [{"name": "thread_name", "ph": "M", "pid": 1, "tid": 1, "args": {"name": "main"}}]
+        for frame in self.frames:
+            events.append(event("frame", frame.start, frame.end))
+            events.extend(event(span.name, span.start, span.end) for span in frame.spans)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}))
+
+    def draw(self, display, fps_cap, x, bottom):
+        """
+        Draws the last OVERLAY_FRAMES frames as stacked bars of their phases (newest on the left), with the average time of every
+        phase next to them. The line is the frame time at the fps cap.
+        """
+        frames = list(self.frames)[-OVERLAY_FRAMES:]
+        if not frames:
+            return
+        top = bottom - OVERLAY_HEIGHT
+        averages = {}
+        for i, frame in enumerate(reversed(frames)):
+            bar_x = x + i * OVERLAY_BAR_WIDTH
+            y = bottom
+            phases = list(frame.phase_times().items())
+            # the rest of the frame goes on top
+            phases.append((None, (frame.end - frame.start) * 1000 - sum(ms for _, ms in phases)))
+            for name, ms in phases:
+                if name is not None:
+                    if name not in self.colors:
+                        self.colors[name] = PHASE_COLORS[len(self.colors) % len(PHASE_COLORS)]
+                    averages[name] = averages.get(name, 0) + ms / len(frames)
+                # bars of slow frames are cut off at the top of the overlay
+                bar_top = max(y - max(ms, 0) * OVERLAY_SCALE, top)
+                pgb.fill_rect(display, self.colors.get(name, OTHER_COLOR), (bar_x, bar_top, OVERLAY_BAR_WIDTH, y - bar_top))
+                y = bar_top
+
+        # frame time at the fps cap
+        width = OVERLAY_FRAMES * OVERLAY_BAR_WIDTH
+        if 1000 / fps_cap * OVERLAY_SCALE <= OVERLAY_HEIGHT:
+            pgb.fill_rect(display, WHITE, (x, bottom - 1000 / fps_cap * OVERLAY_SCALE, width, 1))
+        pgb.draw_rect(display, WHITE, (x, top, width, OVERLAY_HEIGHT), 1)
+
+        # legend of the slowest phases (as many as fit next to the overlay)
+        slowest = sorted(averages.items(), key=lambda item: item[1], reverse=True)[:OVERLAY_HEIGHT // LEGEND_LINE]
+        for i, (name, ms) in enumerate(slowest):
+            legend_y = top + i * LEGEND_LINE
+            pgb.fill_rect(display, self.colors[name], (x + width + 6, legend_y + 3, 8, 8))
+            text.write(display, "topleft", f"{name} : {ms:.2f} ms", fonts.orbitron[12], WHITE, x + width + 18, legend_y)
+
+
+# P R O F I L E R
+profiler = FrameProfiler()
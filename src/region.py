@@ -0,0 +1,187 @@
+import numpy as np
+from threading import Thread, Lock, main_thread
+from queue import Queue, Empty
+from pathlib import Path
+import pickle
+import zlib
+#
+from .engine import *
+
+
+# C O N S T A N T S
+REGION = 32  # a region file holds REGION x REGION chunks
+MAGIC = b"BLKREGN2"
+TABLE_SIZE = REGION * REGION * 3 * 4  # (offset, capacity, length) as uint32 for every chunk
+HEADER_SIZE = len(MAGIC) + TABLE_SIZE
+SECTOR = 512  # slots are allocated in whole sectors, so payloads can grow a bit without having to move
+
+
+# C L A S S E S
+class RegionFile:
+    """
+    A single region file. It starts with a magic and a table of (offset, capacity, length) per chunk, followed by the (compressed)
+    chunk payloads. Every chunk has a slot of whole sectors that it keeps as long as its payload fits. A chunk that outgrows its slot
+    moves to a free space (or the end of the file) and its old slot becomes free, so rewriting chunks doesn't make the file grow
+    beyond the space that its chunks need.
+    """
+    def __init__(self, path):
+        self.path = path
+        if path.exists():
+            with open(path, "rb") as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    raise ValueError(f"{path} is not a region file")
+                self.table = np.frombuffer(f.read(TABLE_SIZE), dtype="<u4").reshape(REGION * REGION, 3).copy()
+        else:
+            self.table = np.zeros((REGION * REGION, 3), dtype="<u4")
+        self.free: list[tuple[int, int]] = []  # (offset, size) of the unused spaces between the slots, in order
+        self.end = HEADER_SIZE                 # where the last slot ends
+        for offset, capacity, _ in sorted(self.table[self.table[:, 1] > 0].tolist()):
+            if offset > self.end:
+                self.free.append((self.end, offset - self.end))
+            self.end = offset + capacity
+
+    def __contains__(self, slot):
+        return bool(self.table[slot, 2])
+
+    def read(self, slot):
+        offset, _, length = self.table[slot].tolist()
+        if not length:
+            return None
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def allocate(self, size):
+        # returns the offset of a free space of the given size, the first one that is large enough
+        for i, (offset, free_size) in enumerate(self.free):
+            if free_size >= size:
+                if free_size == size:
+                    del self.free[i]
+                else:
+                    self.free[i] = (offset + size, free_size - size)
+                return offset
+        offset = self.end
+        self.end += size
+        return offset
+
+    def release(self, offset, size):
+        # gives a slot back, merged with the free spaces around it
+        i = 0
+        while i < len(self.free) and self.free[i][0] < offset:
+            i += 1
+        if i < len(self.free) and offset + size == self.free[i][0]:
+            size += self.free.pop(i)[1]
+        if i > 0 and self.free[i - 1][0] + self.free[i - 1][1] == offset:
+            i -= 1
+            offset, size = self.free[i][0], self.free.pop(i)[1] + size
+        if offset + size == self.end:
+            # nothing after it, so the next slot can start here
+            self.end = offset
+        else:
+            self.free.insert(i, (offset, size))
+
+    def write(self, slot, payload):
+        if not self.path.exists():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "wb") as f:
+                f.write(MAGIC + self.table.tobytes())
+
+        with open(self.path, "r+b") as f:
+            offset, capacity, _ = self.table[slot].tolist()
+            if len(payload) > capacity:
+                if capacity:
+                    self.release(offset, capacity)
+                capacity = -(-len(payload) // SECTOR) * SECTOR
+                offset = self.allocate(capacity)
+            f.seek(offset)
+            f.write(payload)
+            # update the table entry of the chunk
+            self.table[slot] = (offset, capacity, len(payload))
+            f.seek(len(MAGIC) + slot * 12)
+            f.write(self.table[slot].tobytes())
+
+
+class RegionStore:
+    """
+    Chunk records stored in region files. Records are pickled right away (so they are a snapshot of the chunk),
+    but compressing and writing them happens on a background thread.
+    """
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.regions: dict[Pos, RegionFile] = {}
+        self.pending: dict[Pos, bytes] = {}  # records that haven't been written yet
+        self.lock = Lock()
+        self.queue: Queue[tuple[Pos, bytes] | None] = Queue()
+        self.thread: Thread | None = None
+
+    def locate(self, chunk_index):
+        # returns the region file of the chunk (opened lazily) and the slot of the chunk inside of it
+        region_index = (chunk_index[0] // REGION, chunk_index[1] // REGION)
+        if region_index not in self.regions:
+            self.regions[region_index] = RegionFile(self.directory / f"r.{region_index[0]}.{region_index[1]}.region")
+        return self.regions[region_index], chunk_index[1] % REGION * REGION + chunk_index[0] % REGION
+
+    def __contains__(self, chunk_index):
+        with self.lock:
+            if chunk_index in self.pending:
+                return True
+            region, slot = self.locate(chunk_index)
+            return slot in region
+
+    def load(self, chunk_index):
+        """
+        Returns the record of the given chunk, or None if it has never been saved
+        """
+        payload = None
+        with self.lock:
+            if (data := self.pending.get(chunk_index)) is None:
+                region, slot = self.locate(chunk_index)
+                payload = region.read(slot)
+        if payload is not None:
+            data = zlib.decompress(payload)
+        return None if data is None else pickle.loads(data)
+
+    def save(self, chunk_index, record):
+        data = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.pending[chunk_index] = data
+        if self.thread is None:
+            # not a daemon, so records that are still queued when the game quits get written anyway
+            self.thread = Thread(target=self.writer, name="region-writer")
+            self.thread.start()
+        self.queue.put((chunk_index, data))
+
+    def writer(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=0.5)
+            except Empty:
+                # stop once everything is written and the game has exited (even if close was never called)
+                if not main_thread().is_alive():
+                    return
+                continue
+            if item is None:
+                self.queue.task_done()
+                return
+
+            chunk_index, data = item
+            payload = zlib.compress(data)
+            with self.lock:
+                region, slot = self.locate(chunk_index)
+                region.write(slot, payload)
+                # the chunk might have been saved again in the meantime
+                if self.pending.get(chunk_index) is data:
+                    del self.pending[chunk_index]
+            self.queue.task_done()
+
+    def flush(self):
+        """
+        Blocks until all records have been written
+        """
+        self.queue.join()
+
+    def close(self):
+        # the writer thread finishes the queue on its own
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread = None
@@ -0,0 +1,55 @@
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+
+# C L A S S E S
+class Sampler:
+    """
+    Sampling profiler: a background thread records the call stacks of all other threads sample_rate times per second.
+    Unlike cProfile, the profiled code runs at (almost) its normal speed, because nothing happens on its own function calls.
+    The stacks are written in the collapsed format ("thread;outer;...;inner count" per line) that flamegraph.pl,
+    speedscope and inferno read.
+    """
+    def __init__(self, sample_rate):
+        self.interval = 1 / sample_rate
+        self.stacks: Counter[str] = Counter()
+        self.num_samples = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="sampler", daemon=True)
+        self.switch_interval = sys.getswitchinterval()
+
+    def start(self):
+        # a busy thread only hands over the GIL every switch interval (5 ms by default), which would limit the sample rate
+        sys.setswitchinterval(min(self.switch_interval, self.interval))
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        sys.setswitchinterval(self.switch_interval)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == self.thread.ident:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_qualname} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            self.stacks[";".join(reversed(stack))] += 1
+        self.num_samples += 1
+
+    def write(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
@@ -0,0 +1,51 @@
+import time
+from collections.abc import Callable
+#
+from .engine import *
+
+
+# C L A S S E S
+@dataclass
+class Job:
+    name: str
+    func: Callable[[float], bool]  # does work for at most the given time (in ms) and returns whether there is work left
+    priority: int = 0               # higher runs first
+    waited: int = 0                 # frames in a row that the job had work left, but no time to run
+    pending: bool = True            # whether the job had work left after its last run
+    elapsed: float = 0              # time (in ms) the job took during the last frame
+
+
+class FrameScheduler:
+    """
+    Runs deferrable work in a fixed time budget per frame, so a burst of background work (e.g. lots of chunks coming in
+    from the worker pool at once) is spread over several frames instead of causing a lag spike.
+    Jobs are called every frame by priority until the budget is used up. A job decides itself how much it does with the
+    time it gets, and whatever it couldn't finish is simply left for the next frames.
+    Jobs that had to be skipped gain priority every frame, so they can't starve.
+    """
+    def __init__(self):
+        self.jobs: list[Job] = []
+
+    def add(self, name, func, priority=0):
+        self.jobs.append(Job(name, func, priority))
+
+    def run(self, budget):
+        """
+        Runs the jobs by priority until the budget (in ms) is used up
+        """
+        start = time.perf_counter()
+        for job in sorted(self.jobs, key=lambda job: job.priority + job.waited, reverse=True):
+            remaining = budget - (time.perf_counter() - start) * 1000
+            if remaining <= 0:
+                job.elapsed = 0
+                job.waited += job.pending
+                continue
+            job_start = time.perf_counter()
+            job.pending = job.func(remaining)
+            job.elapsed = (time.perf_counter() - job_start) * 1000
+            job.waited = 0
+
+    @property
+    def backlog(self):
+        # names of the jobs that have work left
+        return [job.name for job in self.jobs if job.pending]
@@ -0,0 +1,127 @@
+import numpy as np
+import json
+import random
+#
+from .engine import *
+from .blocks import registry, surf_images, X
+from .terrain import Biome
+
+
+# C L A S S E S
+@dataclass
+class Structure:
+    """
+    A template of blocks, pre-parsed into offset arrays so it can be stamped anywhere at once.
+    Offsets are relative to the origin of the structure (the block it stands on for trees).
+    """
+    name: str
+    offsets: np.ndarray  # (n, 2) int64 of (x, y)
+    ids: np.ndarray      # (n,) uint16 block ids
+
+    @classmethod
+    def from_blocks(cls, name, blocks_):
+        # blocks_ is a {(x, y): block_name} map; later blocks are stamped over earlier ones
+        offsets = np.array([*blocks_.keys()], dtype=np.int64).reshape(-1, 2)
+        return cls(name, offsets, registry.lut(blocks_.values()))
+
+    @property
+    def bounds(self):
+        # (min_x, min_y, max_x, max_y) of the offsets
+        return (*self.offsets.min(axis=0).tolist(), *self.offsets.max(axis=0).tolist())
+
+
+# F U N C T I O N S
+def parse_name(name):
+    """
+    Converts a block name of the structure files (where the "_bg" suffix means background) to a registry name.
+    Returns None for blocks that don't exist (yet).
+    """
+    if name.endswith("_bg"):
+        name = name.removesuffix("_bg") | X.b
+    return name if name in surf_images else None
+
+
+def load_structures(path):
+    structures = {}
+    with open(path) as f:
+        for struct_name, template in json.load(f).items():
+            blocks_ = {}
+            for offset, block_name in template.items():
+                if (name := parse_name(block_name)) is not None:
+                    blocks_[tuple(int(v) for v in offset.split(","))] = name
+            # empty templates (or templates with only unknown blocks) have nothing to stamp
+            if blocks_:
+                structures[struct_name] = Structure.from_blocks(struct_name, blocks_)
+    return structures
+
+
+def forest_tree(rng):
+    # stem of wood_f blocks with random leaves on the sides and one leaf on top
+    blocks_ = {}
+    tree_height = min(max(int(rng.gauss(9, 2)), 1), 14)
+    for tree_yo in range(tree_height):
+        wood_x, wood_y = 0, -tree_yo - 1 - 5
+        wood_suffix = ""
+        leaf_name = "leaf_f"
+        leaf_chance = 1 / 2.4
+        if tree_yo > 0:
+            if rng.random() < leaf_chance:
+                wood_suffix += "L"
+                blocks_[(wood_x - 1, wood_y)] = leaf_name
+            if rng.random() < leaf_chance:
+                wood_suffix += "R"
+                blocks_[(wood_x + 1, wood_y)] = leaf_name
+            if tree_yo == tree_height - 1:
+                wood_suffix += "T"
+                blocks_[(wood_x, wood_y - 1)] = leaf_name
+        wood_suffix = "N" if not wood_suffix else wood_suffix
+        blocks_[(wood_x, wood_y)] = f"wood_f_vr{wood_suffix}"
+    return Structure.from_blocks("forest-tree", blocks_)
+
+
+def beach_tree(tree_height):
+    # stem of wood_p blocks with three leaves at the top
+    blocks_ = {(0, -tree_yo - 1): "wood_p" for tree_yo in range(tree_height)}
+    blocks_ |= {(-1, -tree_height): "leaf_f", (0, -tree_height - 1): "leaf_f", (1, -tree_height): "leaf_f"}
+    return Structure.from_blocks("beach-tree", blocks_)
+
+
+def stamp(structure, origins):
+    """
+    Stamps the structure at all of the given origins at once.
+    Returns the absolute positions (n, 2) and block ids (n,) of every stamped block, in stamping order.
+    """
+    origins = np.asarray(origins, dtype=np.int64).reshape(-1, 1, 2)
+    positions = (origins + structure.offsets[None, :, :]).reshape(-1, 2)
+    ids = np.tile(structure.ids, len(origins))
+    return positions, ids
+
+
+def group_writes(positions, ids):
+    """
+    Groups block writes by the chunk they land in.
+    Returns {chunk_index: (cells, ids)} where cells are flat indices into the [rel_y, rel_x] grids of the chunk, in the original order.
+    """
+    positions = np.asarray(positions, dtype=np.int64).reshape(-1, 2)
+    ids = np.asarray(ids, dtype=np.uint16)
+    if not len(ids):
+        return {}
+    chunks = np.stack([positions[:, 0] // CW, positions[:, 1] // CH], axis=1)
+    cells = (positions[:, 1] % CH) * CW + positions[:, 0] % CW
+    chunk_indices, inverse = np.unique(chunks, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    writes = {}
+    for i, chunk_index in enumerate(chunk_indices.tolist()):
+        selected = inverse == i
+        writes[tuple(chunk_index)] = (cells[selected], ids[selected])
+    return writes
+
+
+# S T R U C T U R E  A S S E T S
+structures = load_structures(Path("res", "structures.json"))
+
+# trees are generated as a fixed set of variants, so placing one is just a copy of its offsets
+trees = {
+    Biome.FOREST: [forest_tree(random.Random(i)) for i in range(32)],
+    Biome.BEACH: [beach_tree(tree_height) for tree_height in range(5, 14)],
+}
@@ -0,0 +1,248 @@
+import numpy as np
+from functools import lru_cache
+#
+from .engine import *
+
+
+# C L A S S E S
+class Biome(Enum):
+    FOREST = auto()
+    MOUNTAIN = auto()
+    BEACH = auto()
+
+
+@dataclass
+class BiomeData:
+    blocks = {
+        # cherry on top, main block, subblock
+        Biome.FOREST: ("soil_f", "dirt_f"),
+        Biome.MOUNTAIN: ("snow-stone", "stone"),
+        Biome.BEACH: ("sand", "sand"),
+    }
+
+
+bio = BiomeData()
+
+
+# C O N S T A N T S
+# every block name the terrain generator can output; layers are returned as indices into this list (0 means no block)
+NAMES = [None, "air", "stone", "stone|b", "blackstone", "coal", "iron", "diamond", "dirt_f|b"]
+for _top, _main in bio.blocks.values():
+    for _name in (_top, _main, f"{_main}|b", f"{_top}|b"):
+        if _name not in NAMES:
+            NAMES.append(_name)
+INDEX = {name: i for i, name in enumerate(NAMES)}
+
+# independent random streams of a chunk
+TERRAIN_STREAM = 0
+DECORATION_STREAM = 1
+ORE_STREAM = 2
+TREE_STREAM = 3
+TREE_VARIANT_STREAM = 4
+PYRAMID_STREAM = 5
+_MASK64 = (1 << 64) - 1
+
+# simplex noise tables, identical to the ones of the `noise` package so terrain stays the same for a given seed
+_PERM = np.array([
+    151, 160, 137, 91, 90, 15, 131, 13, 201, 95, 96, 53, 194, 233, 7, 225,
+    140, 36, 103, 30, 69, 142, 8, 99, 37, 240, 21, 10, 23, 190, 6, 148,
+    247, 120, 234, 75, 0, 26, 197, 62, 94, 252, 219, 203, 117, 35, 11, 32,
+    57, 177, 33, 88, 237, 149, 56, 87, 174, 20, 125, 136, 171, 168, 68, 175,
+    74, 165, 71, 134, 139, 48, 27, 166, 77, 146, 158, 231, 83, 111, 229, 122,
+    60, 211, 133, 230, 220, 105, 92, 41, 55, 46, 245, 40, 244, 102, 143, 54,
+    65, 25, 63, 161, 1, 216, 80, 73, 209, 76, 132, 187, 208, 89, 18, 169,
+    200, 196, 135, 130, 116, 188, 159, 86, 164, 100, 109, 198, 173, 186, 3, 64,
+    52, 217, 226, 250, 124, 123, 5, 202, 38, 147, 118, 126, 255, 82, 85, 212,
+    207, 206, 59, 227, 47, 16, 58, 17, 182, 189, 28, 42, 223, 183, 170, 213,
+    119, 248, 152, 2, 44, 154, 163, 70, 221, 153, 101, 155, 167, 43, 172, 9,
+    129, 22, 39, 253, 19, 98, 108, 110, 79, 113, 224, 232, 178, 185, 112, 104,
+    218, 246, 97, 228, 251, 34, 242, 193, 238, 210, 144, 12, 191, 179, 162, 241,
+    81, 51, 145, 235, 249, 14, 239, 107, 49, 192, 214, 31, 181, 199, 106, 157,
+    184, 84, 204, 176, 115, 121, 50, 45, 127, 4, 150, 254, 138, 236, 205, 93,
+    222, 114, 67, 29, 24, 72, 243, 141, 128, 195, 78, 66, 215, 61, 156, 180,
+] * 2, dtype=np.intp)
+_GRAD2 = np.array([
+    (1, 1), (-1, 1), (1, -1), (-1, -1),
+    (1, 0), (-1, 0), (1, 0), (-1, 0),
+    (0, 1), (0, -1), (0, 1), (0, -1),
+], dtype=np.float32)
+_F2 = np.float32(0.3660254037844386)  # 0.5 * (sqrt(3) - 1)
+_G2 = np.float32(0.21132486540518713)  # (3 - sqrt(3)) / 6
+
+
+# F U N C T I O N S
+def snoise2(x, y, base=0):
+    """
+    Vectorized port of noise.snoise2 (single octave, float32 like the C version), so it returns the exact same values
+    """
+    x = np.asarray(x, dtype=np.float32) + np.float32(base)
+    y = np.asarray(y, dtype=np.float32) + np.float32(base)
+    s = (x + y) * _F2
+    i = np.floor(x + s)
+    j = np.floor(y + s)
+    t = (i + j) * _G2
+
+    # the three simplex corners relative to the point
+    x0 = x - (i - t)
+    y0 = y - (j - t)
+    i1 = x0 > y0
+    j1 = ~i1
+    x1 = x0 - i1.astype(np.float32) + _G2
+    y1 = y0 - j1.astype(np.float32) + _G2
+    x2 = x0 + _G2 * np.float32(2) - np.float32(1)
+    y2 = y0 + _G2 * np.float32(2) - np.float32(1)
+
+    # gradient of every corner
+    I = i.astype(np.intp) & 255
+    J = j.astype(np.intp) & 255
+    grads = (
+        _PERM[I + _PERM[J]] % 12,
+        _PERM[I + i1 + _PERM[J + j1]] % 12,
+        _PERM[I + 1 + _PERM[J + 1]] % 12,
+    )
+
+    # sum up the contributions
+    total = np.float32(0)
+    for g, xx, yy in zip(grads, (x0, x1, x2), (y0, y1, y2)):
+        f = np.float32(0.5) - xx * xx - yy * yy
+        n = f * f * f * f * (_GRAD2[g, 0] * xx + _GRAD2[g, 1] * yy)
+        total = total + np.where(f > 0, n, np.float32(0))
+    return total * np.float32(70)
+
+
+def fast_noise(seed, x, y, freq):
+    return (snoise2(np.multiply(x, freq), np.multiply(y, freq), base=seed).astype(np.float64) + 1) / 2
+
+
+def roll_ores(rng, shape):
+    """
+    Rolls an ore for every block of the given shape (in percent)
+    """
+    r = rng.random(shape) * 100
+    return np.select(
+        [r <= 0.1, r <= 0.5, r <= 1],
+        [INDEX["diamond"], INDEX["iron"], INDEX["coal"]],
+        INDEX["stone"],
+    ).astype(np.uint8)
+
+
+def splitmix64(x):
+    x = (x + 0x9E3779B97F4A7C15) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return x ^ (x >> 31)
+
+
+def chunk_seed(seed, chunk_index, stream=TERRAIN_STREAM):
+    """
+    64-bit seed of a random stream of the given chunk. It only depends on the world seed, the chunk and the stream,
+    so a chunk comes out the same in every process, in any order and after being regenerated.
+    """
+    h = splitmix64(seed & _MASK64)
+    for value in (chunk_index[0], chunk_index[1], stream):
+        h = splitmix64(h ^ (value & _MASK64))
+    return h
+
+
+def spatial_hash(seed, block_x, block_y, stream):
+    """
+    Vectorized splitmix64 hash of block positions to floats in [0, 1). Like chunk_seed, it only depends on the world seed,
+    the position and the stream, so whatever gets placed with it doesn't depend on the order chunks are generated in.
+    """
+    h = np.uint64(splitmix64(splitmix64(seed & _MASK64) ^ stream))
+    for value in np.broadcast_arrays(np.asarray(block_x, dtype=np.int64), np.asarray(block_y, dtype=np.int64)):
+        h = _splitmix64_array(h ^ value.astype(np.uint64))
+    return (h >> np.uint64(11)).astype(np.float64) / (1 << 53)
+
+
+def _splitmix64_array(x):
+    # same as splitmix64, but uint64 arrays wrap around on their own
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def chunk_rng(seed, chunk_index):
+    return np.random.default_rng(chunk_seed(seed, chunk_index, TERRAIN_STREAM))
+
+
+def generate_chunk(seed, chunk_index):
+    """
+    Entry point of the chunk worker processes
+    """
+    return generate(seed, chunk_index, chunk_rng(seed, chunk_index))
+
+
+@lru_cache(maxsize=256)
+def cached_chunk(seed, chunk_index):
+    """
+    Same as generate_chunk, but remembers the most recent chunks. Used to look into the terrain of the neighbours while decorating.
+    The arrays are shared, so don't modify them.
+    """
+    return generate_chunk(seed, chunk_index)
+
+
+def generate(seed, chunk_index, rng, biome=Biome.FOREST):
+    """
+    Generates the terrain of a whole chunk in one pass.
+    Returns the foreground and the background layer as uint8 indices into NAMES, indexed by [rel_y, rel_x].
+    """
+    chunk_x, chunk_y = chunk_index
+    block_x = np.arange(CW) + chunk_x * CW
+    block_y = np.arange(CH)[:, None] + chunk_y * CH
+    rel_y = np.arange(CH)[:, None]
+    fg = np.zeros((CH, CW), dtype=np.uint8)
+    bg = np.zeros((CH, CW), dtype=np.uint8)
+
+    # biome blocks
+    top_name, main_name = bio.blocks[biome]
+    top, main = INDEX[top_name], INDEX[main_name]
+    top_bg = INDEX["dirt_f|b"] if top_name == "soil_f" else INDEX[f"{top_name}|b"]
+    main_bg = INDEX[f"{main_name}|b"]
+
+    # masks of the different layers of the world
+    sky = np.broadcast_to(block_y < 0, (CH, CW))
+    surface = np.broadcast_to((0 <= block_y) & (block_y < 16), (CH, CW))
+    hybrid = np.broadcast_to((16 <= block_y) & (block_y < 32), (CH, CW))
+    underground = np.broadcast_to((32 <= block_y) & (block_y < 320), (CH, CW))
+    depth_limit = np.broadcast_to(block_y >= 320, (CH, CW))
+
+    # SKY
+    fg[sky] = INDEX["air"]
+
+    # chunks 0 and 1 need 1D noise for terrain height
+    if surface.any() or hybrid.any():
+        offset = (fast_noise(seed, block_x, 0, freq=0.04) * CW * 0.5).astype(int)[None, :]
+
+    # SURFACE LEVEL
+    if surface.any():
+        # top block in a biome, air above it and underground blocks below it
+        is_top = surface & (rel_y == offset)
+        is_air = surface & (rel_y < offset)
+        is_under = surface & (rel_y > offset)
+        fg[is_top] = top
+        bg[is_top] = top_bg
+        fg[is_air] = INDEX["air"]
+        fg[is_under] = main
+        bg[is_under] = main_bg
+
+    # DIRT-STONE HYBRID
+    if hybrid.any():
+        is_dirt = hybrid & (rel_y <= offset)
+        is_stone = hybrid & (rel_y > offset)
+        fg[is_dirt] = main
+        bg[is_dirt] = main_bg
+        fg[is_stone] = roll_ores(rng, (CH, CW))[is_stone]
+        bg[is_stone] = INDEX["stone|b"]
+
+    # UNDERGROUND
+    if underground.any():
+        cave = fast_noise(seed, block_x[None, :], block_y, freq=0.06) < 0.5
+        fg[underground] = np.where(cave, INDEX["stone|b"], roll_ores(rng, (CH, CW)))[underground]
+        bg[underground] = INDEX["stone|b"]
+
+    # DEPTH LIMIT
+    fg[depth_limit] = INDEX["blackstone"]
+
+    return fg, bg
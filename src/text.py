@@ -0,0 +1,77 @@
+from collections import OrderedDict
+#
+from .engine import *
+from .window import *
+
+
+# C O N S T A N T S
+CACHE_SIZE = 512  # rendered texts kept by the cache
+
+
+# C L A S S E S
+class TextCache:
+    """
+    Rendered texts (surfaces, or textures on the GPU) by (text, font, color), so text that is written every frame is only
+    rasterized (and uploaded) when it changes. The least recently used texts are dropped once there are more than max_size.
+    """
+    def __init__(self, max_size=CACHE_SIZE):
+        self.max_size = max_size
+        self.images: OrderedDict[tuple, pygame.Surface | Texture] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text, font, color):
+        key = (text, font, tuple(color))
+        try:
+            image = self.images[key]
+        except KeyError:
+            self.misses += 1
+            self.images[key] = image = render(text, font, color)
+            if len(self.images) > self.max_size:
+                self.images.popitem(last=False)
+        else:
+            self.hits += 1
+            self.images.move_to_end(key)
+        return image
+
+
+class Label:
+    """
+    Text that is always written at the same place (e.g. a line of the HUD). It keeps its own image and only renders it again
+    when the text or the color change, so static lines neither get rasterized every frame nor get evicted from the cache.
+    """
+    def __init__(self, anchor, font, x, y):
+        self.anchor = anchor
+        self.font = font
+        self.pos = (x, y)
+        self.text = None
+        self.color = None
+        self.image = None
+        self.rect = None
+
+    def draw(self, display, text, color):
+        text, color = str(text), tuple(color)
+        if (text, color) != (self.text, self.color):
+            self.text, self.color = text, color
+            self.image = render(text, self.font, color)
+            self.rect = self.image.get_rect(**{self.anchor: self.pos})
+        display.blit(self.image, self.rect)
+
+
+# F U N C T I O N S
+def render(text, font, color):
+    # multiline text is rendered as one image
+    surf = font.render(text, True, color)
+    return pgb.T(surf) if window.gpu else surf
+
+
+def write(display, anchor, text, font, color, x, y):
+    """
+    Same as pgb.write, but the rendered text comes from the cache
+    """
+    image = cache.get(str(text), font, color)
+    display.blit(image, image.get_rect(**{anchor: (x, y)}))
+
+
+# T E X T  C A C H E
+cache = TextCache()
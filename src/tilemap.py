@@ -0,0 +1,79 @@
+import numpy as np
+#
+from .engine import *
+from .window import *
+from .blocks import registry, surf_images
+
+
+# C L A S S E S
+class TileAtlas:
+    """
+    Every block image packed into a single surface (and a single texture on the GPU), with one tile per block id.
+    The atlas is rebuilt when new blocks get registered.
+    """
+    def __init__(self):
+        self.size = 0            # number of block ids the atlas has been built for
+        self.surf = None
+        self.texture = None
+        self.tiles = []          # subsurface of every block id (None if the block has no image)
+        self.areas = []          # (x, y, w, h) of every block id in the atlas
+        self.drawable = None     # bool per block id: whether there is something to draw
+        self.opaque = None       # bool per block id: whether the image covers its whole tile (and the wall behind it)
+
+    def update(self):
+        if self.size == len(registry):
+            return
+        self.size = len(registry)
+        cols = ceil(sqrt(self.size))
+        self.surf = pygame.Surface((cols * BS, ceil(self.size / cols) * BS), pygame.SRCALPHA)
+        self.tiles, self.areas = [], []
+        self.drawable = np.zeros(self.size, dtype=bool)
+        self.opaque = np.zeros(self.size, dtype=bool)
+        for id_, name in enumerate(registry.names):
+            area = (id_ % cols * BS, id_ // cols * BS, BS, BS)
+            image = surf_images.get(name)
+            if image is None or name == "air":
+                self.tiles.append(None)
+                self.areas.append(area)
+                continue
+            self.surf.blit(image, area[:2], special_flags=pygame.BLEND_RGBA_MAX)  # an exact copy, blending onto the empty atlas would round the colors
+            self.tiles.append(self.surf.subsurface(area))
+            self.areas.append(area)
+            self.drawable[id_] = True
+            self.opaque[id_] = image.get_colorkey() is None and (not image.get_flags() & pygame.SRCALPHA or pygame.surfarray.pixels_alpha(image).min() == 255)
+        if window.gpu:
+            self.texture = pgb.T(self.surf)
+
+
+# F U N C T I O N S
+def draw_tiles(display, blocks_, walls, topleft):
+    """
+    Draws the given block and wall id grids (a [rel_y, rel_x] slice of a chunk) with their top left corner at topleft, all in one batch.
+    Walls are only drawn behind blocks that don't cover them completely.
+    """
+    atlas.update()
+    ys, xs = np.nonzero(blocks_)
+    ids = blocks_[ys, xs]
+    wall_ids = walls[ys, xs]
+    xs = (topleft[0] + xs * BS).tolist()
+    ys = (topleft[1] + ys * BS).tolist()
+
+    # walls first, so the blocks end up on top
+    visible_walls = (atlas.drawable[wall_ids] & ~atlas.opaque[ids]).tolist()
+    visible_blocks = atlas.drawable[ids].tolist()
+    ids, wall_ids = ids.tolist(), wall_ids.tolist()
+    batch = [(wall_id, x, y) for wall_id, x, y, visible in zip(wall_ids, xs, ys, visible_walls) if visible]
+    batch += [(id_, x, y) for id_, x, y, visible in zip(ids, xs, ys, visible_blocks) if visible]
+
+    if window.gpu:
+        # the renderer has no batched blits, but every tile comes from the same texture
+        draw, areas = atlas.texture.draw, atlas.areas
+        for id_, x, y in batch:
+            draw(areas[id_], (x, y, BS, BS))
+    else:
+        tiles = atlas.tiles
+        display.fblits([(tiles[id_], (x, y)) for id_, x, y in batch])
+
+
+# T I L E  A S S E T S
+atlas = TileAtlas()
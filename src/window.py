@@ -1,4 +1,5 @@
 import pygame
+import os
 from pathlib import Path
 import tomllib as toml
 from random import uniform as randf
@@ -16,7 +17,16 @@ pygame.init()
 
 
 class WindowHandler:
-    def __init__(self, width, height, fullscreen, vsync, fps_cap, gpu):
+    def __init__(self, width, height, fullscreen, vsync, fps_cap, gpu, headless=False):
+        # without a window there's no GPU and no screen to fill either
+        self.headless = headless
+        if headless:
+            # SDL's dummy driver, even if pygame has already been initialized with a real one
+            os.environ["SDL_VIDEODRIVER"] = "dummy"
+            pygame.display.quit()
+            pygame.display.init()
+            gpu = fullscreen = vsync = False
+
         # window parameters
         self.width = width
         self.height = height
@@ -32,7 +42,11 @@ class WindowHandler:
 
         pygame.mouse.set_cursor(pygame.cursors.tri_left)
 
-        if gpu:
+        if headless:
+            # everything is drawn onto the surface of a hidden window on the dummy driver (images are never converted to textures)
+            self.window = Window(size=self.size, hidden=True)
+            self.display = self.window.get_surface()
+        elif gpu:
             self.window = Window(size=self.size)
             self.display = Renderer(self.window, vsync=vsync)
 
@@ -70,4 +84,7 @@ class WindowHandler:
 
 with open(Path("config", "config.toml"), "rb") as f:
     config = toml.load(f)
+    # BLOCKS_HEADLESS=1 turns on the headless mode without touching the config (e.g. for CI)
+    if int(os.environ.get("BLOCKS_HEADLESS", 0)):
+        config["window"]["headless"] = True
     window = WindowHandler(**config["window"])
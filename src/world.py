@@ -1,10 +1,11 @@
 import opensimplex as osim
-import noise
+import numpy as np
 from enum import Enum
-from collections import deque
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, Future
+import multiprocessing
 import secrets
-import json
-import pickle
+import copy
 #
 from pyengine.pgbasics import *
 from pyengine.ecs import *
@@ -12,33 +13,36 @@ from pyengine.ecs import *
 from .engine import *
 from .window import *
 from .entities import *
+from .chunk import Chunk, ChunkStage, STAGE_REACH, BlockLayer, LightLayer
+from .region import RegionStore
+from .terrain import Biome, bio
 from .blocks import (
     BF, bwand, nbwand, MAX_LIGHT, X
 )
 from . import fonts
 from . import blocks
+from . import terrain
+from . import structures
+from . import lighting
+from . import tilemap
+from . import text
+from .scheduler import FrameScheduler
+from .profiler import profiler
+
+
+# C O N S T A N T S
+PLACEHOLDER_COLOR = (40, 40, 40)
+PREFETCH_MIN_VEL = 0.5  # below this speed (px per frame) the prefetch ring is not biased
+STAGE_STREAMS = {
+    ChunkStage.ORES: terrain.ORE_STREAM,
+    ChunkStage.DECORATIONS: terrain.DECORATION_STREAM,
+    ChunkStage.ENTITIES: terrain.DECORATION_STREAM,
+}
+MIN_JOB_BUDGET = 1  # ms that deferred work gets every frame, even when the frame is already late
+STAGE_SPREAD = 4  # how far (in chunks) building a chunk can pull the generation of other chunks along
 
 
 # C L A S S E S
-class Biome(Enum):
-    FOREST = auto()
-    MOUNTAIN = auto()
-    BEACH = auto()
-
-
-@dataclass
-class BiomeData:
-    blocks = {
-        # cherry on top, main block, subblock
-        Biome.FOREST: ("soil_f", "dirt_f"),
-        Biome.MOUNTAIN: ("snow-stone", "stone"),
-        Biome.BEACH: ("sand", "sand"),
-    }
-
-
-bio = BiomeData()
-
-
 @dataclass
 class Breaking:
     index: tuple[int, int] | None = None
@@ -53,6 +57,15 @@ class World:
         self.cache_chunk_textures: bool
         self.lighting: bool
         self.cache_light_textures: bool
+        self.chunk_workers: int
+        self.chunk_budget: float
+        self.prefetch_radius: int
+        self.prefetch_budget: int
+        self.max_resident_chunks: int
+        self.keep_radius: int
+        self.seed: int  # optional, a random seed is used when it's missing
+        self.autosave_interval: float  # in seconds
+        self.job_budget: float  # share of the frame time (at the fps cap) that deferred work may use
 
         for attr, value in kwargs.items():
             setattr(self, attr, value)
@@ -63,48 +76,104 @@ class World:
         # fixes
         self.menu.lighting.checked = bool(self.lighting)
 
-        # block data
-        self.data = {}
-        self.late_data = {}
-        self.bg_data = {}
-        self.wall_data = {}
+        # block data (views over the array-backed chunks)
+        self.chunks:    dict[Pos, Chunk]                                    = {} # chunk storage
+        self.data:      dict[Pos, BlockLayer]                               = {} # foreground blocks
+        self.bg_data:   dict[Pos, BlockLayer]                               = {} # blocks revealed when breaking
+        self.wall_data: dict[Pos, BlockLayer]                               = {} # background walls
         self.chunk_surfaces = {}
         if window.gpu:
             self.chunk_textures = {}
+            self.texture_dirty: dict[Pos, pygame.Rect] = {}  # area of the chunk surfaces that hasn't been uploaded to their texture yet
+        self.texture_uploads = 0  # textures created or updated during the current frame
         self.chunk_colors = {}
-        self.chunk_queue = deque()
-        # DThread(target=self.chunk_worker).start()
+
+        # chunk generation worker pool (spawned, forking a process with SDL and background threads running can deadlock)
+        self.pool = ProcessPoolExecutor(max_workers=self.chunk_workers, mp_context=multiprocessing.get_context("spawn")) if self.chunk_workers else None
+        self.pending_chunks: dict[Pos, Future] = {}  # chunks that are being generated by the pool
+        self.ready_chunks: deque[Pos] = deque()      # chunks whose generation has finished, in order of completion
+
+        # chunk unloading
+        self.chunk_lru: OrderedDict[Pos, None] = OrderedDict()  # built chunks, least recently rendered first
 
         # block lighting
-        self.lightmap:           dict[Pos, dict[Pos, int]]                  = {} # light data
+        self.lightmap:           dict[Pos, LightLayer]                      = {} # light data
         self.light_surfaces:     dict[Pos, dict[Pos, pygame.Surface]]       = {} # light surfaces
         if window.gpu:
             self.light_textures: dict[Pos, dict[Pos, Texture]]              = {} # light textures
-        self.source_to_children: dict[Pos, dict[Pos, set[tuple[Pos, Pos]]]] = {} # saves all blocks that have been affected by a light source
-        self.child_to_source:    dict[tuple[Pos, Pos], tuple[Pos, Pos]]     = {} # pointer from all children to their parent
+        self.light_dirty:        set[Pos]                                   = set() # chunks whose light surface is rebuilt before the next lighting blit
+        self.light_queue:        deque[tuple[Pos, Pos | None, bool]]        = deque() # (chunk_index, block_pos, removed) of the light sources whose light the scheduler spreads or removes
         self.light_thread_active = False
 
+        # sky lighting
+        self.daylight = 1.0  # how bright the sky light is (0 at night)
+        self.sky_dirty: set[Pos] = set()  # chunks whose sky light is recomputed by the scheduler
+
         # world interactive stuff
         self.breaking = Breaking()
 
         # seed
         self.create_world() 
-        self.seed = secrets.randbits(16)
+        self.seed = getattr(self, "seed", None) or secrets.randbits(16)
         window.window.title = f"Seed: {self.seed}"
         # osim.seed(self.seed)
-        self.random = random.Random(self.seed)
+
+        # saved chunks (loaded lazily when they are needed)
+        self.regions = RegionStore(Path(".game_data", str(self.seed), "regions"))
+        self.last_autosave = ticks()
+        self.autosave_queue: deque[Pos] = deque()  # chunks that the running autosave hasn't saved yet
+
+        # deferred work that is spread over the frames
+        self.rendered_chunks: set[Pos] = set()  # chunks that were on screen during the last frame
+        self.scheduler = FrameScheduler()
+        self.scheduler.add("chunks", self.integrate_chunks, priority=3)
+        self.scheduler.add("propagation", self.propagate_lights, priority=3)
+        self.scheduler.add("sky", self.update_skies, priority=3)
+        self.scheduler.add("textures", self.upload_textures, priority=2)
+        self.scheduler.add("light", self.render_light_surfaces, priority=2)
+        self.scheduler.add("autosave", self.autosave)
+
+        # lookup tables from terrain generator output to block ids
+        self.terrain_ids = blocks.registry.lut(terrain.NAMES)
+        self.terrain_walls = np.where([name is not None and "b" in blocks.norm(name)[1] for name in terrain.NAMES], self.terrain_ids, 0).astype(np.uint16)
     
     # S A V I N G  A N D  L O A D I N G
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+        # returns right away, the region writer finishes in the background
+        self.regions.close()
+
     def save(self):
-        return
-        world_data = {
-            "seed": self.seed,
-            "data": {str(k): {str(i): j for i, j in v.items()} for k, v in self.data.items()},
-        }
-        with open(Path(".game_data", f"{self.seed}.json"), "w") as f:
-            json.dump(world_data, f)
-        with open(Path(".game_data", f"{self.seed}.world"), "w") as f:
-            pickle.dump(ecs.serialize(), f)
+        """
+        Saves every loaded chunk that has been edited (or has entities) since the last save. The writing happens in the background.
+        """
+        for chunk_index in self.data:
+            self.save_chunk(chunk_index, list(get_entities(chunk_index).values()))
+
+    def save_chunk(self, chunk_index, entities):
+        chunk = self.chunks[chunk_index]
+        entities = [comps for comps in entities if is_savable(comps)]
+        # chunks without edits or entities are only saved once, so their entities aren't spawned again when they are regenerated
+        if chunk.dirty or entities or chunk_index not in self.regions:
+            self.regions.save(chunk_index, chunk.pack(entities))
+            chunk.saved_version = chunk.version
+
+    def autosave(self, budget):
+        """
+        Saves the loaded chunks every autosave_interval seconds, as many per frame as fit in the budget (in ms).
+        Returns whether there are chunks left to save.
+        """
+        if not self.autosave_queue and ticks() - self.last_autosave >= self.autosave_interval * 1000:
+            self.autosave_queue.extend(self.data)
+            self.last_autosave = ticks()
+        start = time.perf_counter()
+        while self.autosave_queue and (time.perf_counter() - start) * 1000 < budget:
+            chunk_index = self.autosave_queue.popleft()
+            # chunks that have been unloaded in the meantime are saved already
+            if chunk_index in self.data:
+                self.save_chunk(chunk_index, list(get_entities(chunk_index).values()))
+        return bool(self.autosave_queue)
     
     # W O R L D  D A T A  H E L P E R  F U N C T I O N S
     @property
@@ -118,6 +187,34 @@ class World:
     def num_ver_chunks(self):
         return floor((window.height - 2) / (CH * BS)) + 2
     
+    def chunk_window(self, scroll):
+        """
+        Returns the top-left chunk and the size (in chunks) of the area that gets rendered with the given scroll
+        """
+        return (
+            int(round(scroll[0] / (CW * BS))) - 1,
+            int(round(scroll[1] / (CH * BS))) - 1,
+        ), (self.num_hor_chunks, self.num_ver_chunks)
+
+    def visible_blocks(self, scroll):
+        """
+        Returns the range of blocks that are (partially) on screen with the given scroll as (x0, y0, x1, y1), end exclusive
+        """
+        return (
+            floor(scroll[0] / BS),
+            floor(scroll[1] / BS),
+            ceil((scroll[0] + window.width) / BS),
+            ceil((scroll[1] + window.height) / BS),
+        )
+
+    def chunk_view(self, chunk_index, visible):
+        # the [rel_y, rel_x] slices of the chunk grids that lie in the visible block range (None if the chunk is off screen)
+        x0, x1 = max(visible[0] - chunk_index[0] * CW, 0), min(visible[2] - chunk_index[0] * CW, CW)
+        y0, y1 = max(visible[1] - chunk_index[1] * CH, 0), min(visible[3] - chunk_index[1] * CH, CH)
+        if x0 >= x1 or y0 >= y1:
+            return None
+        return slice(y0, y1), slice(x0, x1)
+    
     def get_radius_around(self, radius):
         offsets = []
         for dx in range(-radius, radius + 1):
@@ -130,6 +227,16 @@ class World:
         
         return [(dx, dy) for _, dx, dy in offsets]
     
+    def get_chunk(self, chunk_index):
+        """
+        Returns the storage of the given chunk, allocating empty grids if it doesn't exist yet
+        """
+        try:
+            return self.chunks[chunk_index]
+        except KeyError:
+            self.chunks[chunk_index] = chunk = Chunk(chunk_index)
+            return chunk
+    
     def exists(self, chunk_index, block_pos):
         return chunk_index in self.data and block_pos in self.data[chunk_index]
     
@@ -153,8 +260,8 @@ class World:
         for yo in range(range_y[0], range_y[1] + 1):
             for xo in range(range_x[0], range_x[1] + 1):
                 chunk_index, block_pos = self.correct_tile(og_chunk_index, og_block_pos, xo, yo)
-                if chunk_index in self.data and block_pos in self.data[chunk_index]:
-                    name = self.data[chunk_index][block_pos]
+                if chunk_index in self.data and (id_ := self.chunks[chunk_index].blocks[block_pos[1] % CH, block_pos[0] % CW]):
+                    name = blocks.registry.names[id_]
                     block_rect = pygame.Rect(block_pos[0] * BS, block_pos[1] * BS, BS, BS)
                     base, mods = blocks.norm(name)
                     if return_name:
@@ -220,9 +327,6 @@ class World:
         return chunk_index, block_pos
 
     # W O R L D  G E N E R A T I O N
-    def fast_noise(self, x, y, freq):
-        return (noise.snoise2(x * freq, y * freq, base=self.seed) + 1) / 2
-
     def octave_noise(self, x, y, freq, amp=1, octaves=1, lac=2, pers=0.5):
         height = 0
         max_value = 0
@@ -238,69 +342,321 @@ class World:
         height = (height + max_value) / (max_value * 2)
         return height
 
-    def chunk_worker(self):
-        while True:
-            if self.chunk_queue:
-                chunk_index = self.chunk_queue.popleft()
-                if chunk_index not in self.data:
-                    self.create_chunk(chunk_index)
+    def request_chunk(self, chunk_index):
+        """
+        Queues the terrain generation of the given chunk in the worker pool
+        """
+        if chunk_index not in self.pending_chunks:
+            future = self.pool.submit(terrain.generate_chunk, self.seed, chunk_index)
+            future.add_done_callback(lambda _: self.ready_chunks.append(chunk_index))
+            self.pending_chunks[chunk_index] = future
+            self.get_chunk(chunk_index).stage = ChunkStage.NOISE
+
+    def prefetch(self, scroll, vel, deadline=None):
+        """
+        Generates chunks in a ring around the rendered area before they become visible.
+        The ring reaches prefetch_radius chunks ahead of the movement, nothing behind it and 1 chunk to the sides.
+        Nothing more is generated after the deadline (a perf_counter() time), the chunks that aren't done are picked up again next frame.
+        """
+        (x0, y0), (width, height) = self.chunk_window(scroll)
+        r = self.prefetch_radius
+
+        # direction of the movement
+        dir_x = sign(vel[0]) if abs(vel[0]) > PREFETCH_MIN_VEL else 0
+        dir_y = sign(vel[1]) if abs(vel[1]) > PREFETCH_MIN_VEL else 0
+        left, right = (0, r) if dir_x > 0 else (r, 0) if dir_x < 0 else (1, 1)
+        top, bottom = (0, r) if dir_y > 0 else (r, 0) if dir_y < 0 else (1, 1)
+
+        # missing chunks closest to where the camera is heading go first
+        target = (x0 + width / 2 + dir_x * r, y0 + height / 2 + dir_y * r)
+        missing = [
+            (chunk_x, chunk_y)
+            for chunk_y in range(y0 - top, y0 + height + bottom)
+            for chunk_x in range(x0 - left, x0 + width + right)
+            if (chunk_x, chunk_y) not in self.data and (chunk_x, chunk_y) not in self.pending_chunks
+        ]
+        missing.sort(key=lambda c: (c[0] + 0.5 - target[0]) ** 2 + (c[1] + 0.5 - target[1]) ** 2)
+
+        for chunk_index in missing[:self.prefetch_budget]:
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+            self.advance(chunk_index, sync=self.pool is None, deadline=deadline)
+
+    def integrate_chunks(self, budget):
+        """
+        Takes over the terrain that the worker pool has finished until the budget (in ms) is used up.
+        Returns whether there are finished chunks left.
+        """
+        start = time.perf_counter()
+        while self.ready_chunks and (time.perf_counter() - start) * 1000 < budget:
+            chunk_index = self.ready_chunks.popleft()
+            # the chunk might have been generated synchronously in the meantime
+            if (future := self.pending_chunks.pop(chunk_index, None)) is not None:
+                self.write_terrain(chunk_index, *future.result())
+        return bool(self.ready_chunks)
+
+    def evict_chunks(self, scroll):
+        """
+        Frees the memory of chunks that are far away from the camera.
+        Surfaces and textures of chunks outside the keep radius are dropped right away, and once there are more than max_resident_chunks
+        chunks, the least recently rendered ones are unloaded completely.
+        """
+        (x0, y0), (width, height) = self.chunk_window(scroll)
+        r = self.keep_radius
+        _far = lambda c, r=r: not (x0 - r <= c[0] < x0 + width + r and y0 - r <= c[1] < y0 + height + r)
+
+        # surfaces are by far the biggest part of a chunk, so they go first (they are rebuilt from the grids when needed again)
+        for chunk_index in [c for c in self.chunk_surfaces.keys() | self.light_surfaces.keys() if _far(c)]:
+            self.drop_chunk_surfaces(chunk_index)
+
+        # unload the least recently used chunks that are outside the keep radius
+        excess = len(self.chunk_lru) - self.max_resident_chunks
+        if excess > 0:
+            for chunk_index in [c for c in self.chunk_lru if _far(c)][:excess]:
+                self.unload_chunk(chunk_index)
+
+        # chunks that have been generated partially (for their neighbours) are regenerated when needed again
+        for chunk_index in [c for c in self.chunks if c not in self.data and _far(c, r + STAGE_SPREAD)]:
+            if self.is_leftover(chunk_index):
+                self.drop_chunk(chunk_index)
+
+    def drop_chunk_surfaces(self, chunk_index):
+        self.chunk_surfaces.pop(chunk_index, None)
+        self.light_surfaces.pop(chunk_index, None)
+        self.light_dirty.discard(chunk_index)
+        if window.gpu:
+            self.chunk_textures.pop(chunk_index, None)
+            self.texture_dirty.pop(chunk_index, None)
+            self.light_textures.pop(chunk_index, None)
+
+    def unload_chunk(self, chunk_index):
+        """
+        Saves the edits and entities of the chunk and removes it from memory. It is regenerated when revisited.
+        """
+        self.save_chunk(chunk_index, stash_entities(chunk_index))
+        self.drop_chunk(chunk_index)
+
+        # neighbours that only hold light (and don't border any other built chunk) aren't needed anymore either
+        for yo in range(-1, 2):
+            for xo in range(-1, 2):
+                nei_chunk_index = (chunk_index[0] + xo, chunk_index[1] + yo)
+                if nei_chunk_index in self.chunks and self.is_leftover(nei_chunk_index):
+                    self.drop_chunk(nei_chunk_index)
+
+    def is_leftover(self, chunk_index):
+        # whether the chunk isn't built, isn't waiting for the worker pool and doesn't hold light of a built chunk
+        return chunk_index not in self.data and chunk_index not in self.pending_chunks and not any(
+            (chunk_index[0] + x, chunk_index[1] + y) in self.data for y in range(-1, 2) for x in range(-1, 2)
+        )
+
+    def drop_chunk(self, chunk_index):
+        self.drop_chunk_surfaces(chunk_index)
+        for container in (self.chunks, self.data, self.bg_data, self.wall_data, self.lightmap, self.chunk_colors, self.chunk_lru):
+            container.pop(chunk_index, None)
+        self.sky_dirty.discard(chunk_index)
 
     def create_world(self):
+        self.chunks = {}
         self.data = {}
     
-    def modify_chunk(self, chunk_index):
-        def _set(name, mod_pos):
-            rel_x, rel_y = mod_pos[0] - chunk_index[0] * CW, mod_pos[1] - chunk_index[1] * CH
-            if 0 <= rel_x < CW and 0 <= rel_y < CH:
-                self.set(chunk_index, mod_pos, name, allow_propagation=False)
-            else:
-                xo = mod_pos[0] - block_pos[0]
-                yo = mod_pos[1] - block_pos[1]
-                new_chunk_index, new_block_pos = self.correct_tile(chunk_index, block_pos, xo, yo)
-                if new_chunk_index in self.late_data:
-                    self.late_data[new_chunk_index][new_block_pos] = name
+    def advance(self, chunk_index, stage=ChunkStage.FULL, sync=True, deadline=None):
+        """
+        Runs the generation stages of the given chunk up to the given stage. A stage only runs once all chunks within its reach
+        have finished the previous one, so those are advanced first.
+        Without sync, the terrain of chunks that the worker pool hasn't generated yet is requested instead of waited for.
+        No stage is started after the deadline (a perf_counter() time). The stages that have run are kept in the chunks, so the
+        next call carries on where this one stopped.
+        Returns whether the chunk has reached the stage.
+        """
+        chunk = self.get_chunk(chunk_index)
+        while chunk.stage < stage:
+            if deadline is not None and time.perf_counter() >= deadline:
+                return False
+            next_stage = ChunkStage(chunk.stage + 1)
+            if next_stage == ChunkStage.NOISE:
+                if self.pool is not None and not sync:
+                    self.request_chunk(chunk_index)
                 else:
-                    self.late_data[new_chunk_index] = {new_block_pos: name}
+                    chunk.stage = ChunkStage.NOISE
+            elif next_stage == ChunkStage.TERRAIN:
+                # reuse the worker pool result if the chunk has already been requested
+                if (future := self.pending_chunks.get(chunk_index)) is None:
+                    # the neighbours might have looked into this terrain already
+                    fg, bg = terrain.cached_chunk(self.seed, chunk_index)
+                elif sync or future.done():
+                    fg, bg = self.pending_chunks.pop(chunk_index).result()
+                else:
+                    return False
+                self.write_terrain(chunk_index, fg, bg)
+            elif next_stage == ChunkStage.FULL:
+                self.build_chunk(chunk_index)
+            else:
+                # every neighbour is advanced (instead of stopping at the first one that isn't ready), so all of the missing terrain gets requested at once
+                reach_x, reach_y = STAGE_REACH.get(next_stage, (0, 0))
+                ready = [
+                    self.advance((chunk_index[0] + xo, chunk_index[1] + yo), ChunkStage(next_stage - 1), sync, deadline)
+                    for yo in range(-reach_y, reach_y + 1)
+                    for xo in range(-reach_x, reach_x + 1)
+                ]
+                if not all(ready):
+                    return False
+                self.run_stage(chunk_index, next_stage)
+        return True
+
+    def write_terrain(self, chunk_index, fg, bg):
+        # write the generated terrain straight into the chunk storage
+        chunk = self.get_chunk(chunk_index)
+        chunk.blocks[:] = self.terrain_ids[fg]
+        chunk.bg[:] = self.terrain_ids[bg]
+        if not self.cache_chunk_textures:
+            # background blocks in the foreground are walls as well
+            chunk.walls[:] = self.terrain_walls[fg]
+        chunk.terrain = fg
+        chunk.stage = ChunkStage.TERRAIN
+
+    def get_terrain(self, chunk_index):
+        # the bare foreground terrain of the chunk, which is the same whether the chunk has been generated or not
+        if (chunk := self.chunks.get(chunk_index)) is None or chunk.terrain is None:
+            return terrain.cached_chunk(self.seed, chunk_index)[0]
+        return chunk.terrain
+
+    def terrain_name(self, block_pos):
+        fg = self.get_terrain((block_pos[0] // CW, block_pos[1] // CH))
+        return terrain.NAMES[fg[block_pos[1] % CH, block_pos[0] % CW]]
+
+    def run_stage(self, chunk_index, stage):
+        """
+        Applies the blocks that the given stage of all chunks within its reach places in the given chunk. When several chunks
+        place a block at the same position, the one from the smallest chunk wins, whatever order the chunks were generated in.
+        """
+        reach_x, reach_y = STAGE_REACH.get(stage, (0, 0))
+        sources = sorted((
+            (chunk_index[0] + xo, chunk_index[1] + yo)
+            for yo in range(-reach_y, reach_y + 1)
+            for xo in range(-reach_x, reach_x + 1)
+        ), reverse=True)
+        # all of the writes are computed before any of them is applied, because the chunk is one of the sources itself
+        writes = [self.stage_writes(source, stage).get(chunk_index) for source in sources]
+        chunk = self.chunks[chunk_index]
+        for source_writes in writes:
+            if source_writes is not None:
+                self.write_blocks(chunk, *source_writes)
+        chunk.stage = stage
+
+        # the writes of a source aren't needed anymore once every chunk they can land in has run the stage
+        for source in sources:
+            if all(
+                (nei_chunk := self.chunks.get((source[0] + xo, source[1] + yo))) is not None and nei_chunk.stage >= stage
+                for yo in range(-reach_y, reach_y + 1)
+                for xo in range(-reach_x, reach_x + 1)
+            ):
+                self.chunks[source].writes.pop(stage, None)
+
+    def stage_writes(self, chunk_index, stage):
+        # the blocks a stage of the chunk places, computed once while the chunk is at the previous stage
+        chunk = self.chunks[chunk_index]
+        if stage not in chunk.writes:
+            if chunk.stage >= stage:
+                # the writes have been freed, but a neighbour that has been dropped in the meantime needs them again
+                chunk.writes[stage] = self.replay_writes(chunk_index, stage)
+            elif stage == ChunkStage.STRUCTURES:
+                chunk.writes[stage] = self.place_structures(chunk_index)
+            else:
+                chunk.writes[stage] = self.modify_chunk(chunk_index, stage)
+        return chunk.writes[stage]
+
+    def replay_writes(self, chunk_index, stage):
+        """
+        Generates the chunk up to the previous stage again, in an empty set of chunks, and returns the blocks that the given stage places.
+        The stages only depend on the seed and the positions of the chunks, so these are the same as the ones that have been freed.
+        """
+        # a copy of the world with chunks (and pending terrain) of its own, so the live ones (which e.g. dynamite edits from
+        # its own thread) are left alone
+        scratch = copy.copy(self)
+        scratch.chunks, scratch.pending_chunks, scratch.pool = {}, {}, None
+        scratch.advance(chunk_index, ChunkStage(stage - 1))
+        return scratch.stage_writes(chunk_index, stage)
+
+    def place_structures(self, chunk_index, biome=Biome.FOREST):
+        """
+        Places trees (and pyramids on beaches) on the surface of the chunk. Every surface block rolls a spatial hash, so a structure
+        only depends on the seed and its position, and all structures of one kind are stamped at once.
+        """
+        chunk = self.chunks[chunk_index]
+        chunk_x, chunk_y = chunk_index
+        # surface blocks of the bare terrain (the row above the chunk comes from the terrain of the chunk above)
+        above = np.vstack([self.get_terrain((chunk_x, chunk_y - 1))[-1:], chunk.terrain[:-1]])
+        surface = (chunk.terrain == terrain.INDEX[bio.blocks[biome][0]]) & (above == terrain.INDEX["air"])
+        if not surface.any():
+            return {}
+
+        rel_y, rel_x = np.nonzero(surface)
+        block_x, block_y = rel_x + chunk_x * CW, rel_y + chunk_y * CH
+        origins = np.stack([block_x, block_y], axis=1)
+        stamped = []
+
+        # trees
+        tree_chance = terrain.spatial_hash(self.seed, block_x, block_y, terrain.TREE_STREAM)
+        variants = structures.trees[biome]
+        variant = (terrain.spatial_hash(self.seed, block_x, block_y, terrain.TREE_VARIANT_STREAM) * len(variants)).astype(int)
+        has_tree = tree_chance < 1 / 24
+        for i in np.unique(variant[has_tree]).tolist():
+            stamped.append(structures.stamp(variants[i], origins[has_tree & (variant == i)]))
+
+        # pyramids
+        if biome == Biome.BEACH:
+            has_pyramid = ~has_tree & (terrain.spatial_hash(self.seed, block_x, block_y, terrain.PYRAMID_STREAM) < 1 / 200)
+            stamped.append(structures.stamp(structures.structures["pyramid"], origins[has_pyramid]))
+
+        if not stamped:
+            return {}
+        positions, ids = zip(*stamped)
+        return structures.group_writes(np.concatenate(positions), np.concatenate(ids))
+
+    def modify_chunk(self, chunk_index, stage):
+        """
+        Runs a generation pass over the chunk and returns the blocks it places, grouped by the chunk they land in.
+        Other chunks are only read from their bare terrain, so the result only depends on the seed and the chunk.
+        """
+        chunk = self.chunks[chunk_index]
+        placed: dict[Pos, str] = {}  # so the pass sees its own blocks
+
+        def _set(name, mod_pos):
+            placed[mod_pos] = name
         
         def _get(mod_pos):
+            if mod_pos in placed:
+                return placed[mod_pos]
             rel_x, rel_y = mod_pos[0] - chunk_index[0] * CW, mod_pos[1] - chunk_index[1] * CH
             if 0 <= rel_x < CW and 0 <= rel_y < CH:
-                try:
-                    return self.data[chunk_index][mod_pos]
-                except KeyError:
-                    return "air"
+                return chunk.data.get(mod_pos, "air")
             else:
-                xo = mod_pos[0] - block_pos[0]
-                yo = mod_pos[1] - block_pos[1]
-                new_chunk_index, new_block_pos = self.correct_tile(chunk_index, block_pos, xo, yo)
-                try:
-                    return self.data[new_chunk_index][new_block_pos]
-                except KeyError:
-                    return None
-
-        _chance = lambda p: self.random.random() < p
-        _rand = lambda a, b: self.random.randint(a, b)
-        _nordis = lambda mu, sigma: int(self.random.gauss(mu, sigma))
-        _choice = lambda x: self.random.choice(x)
+                return self.terrain_name(mod_pos)
+
+        # every pass of every chunk has its own random stream, so a regenerated chunk looks the same as before
+        rng = random.Random(terrain.chunk_seed(self.seed, chunk_index, STAGE_STREAMS[stage]))
+        _chance = lambda p: rng.random() < p
+        _rand = lambda a, b: rng.randint(a, b)
+        _nordis = lambda mu, sigma: int(rng.gauss(mu, sigma))
+        _choice = lambda x: rng.choice(x)
 
         biome = Biome.FOREST
 
         chunk_x, chunk_y = chunk_index
-        _spawned = False
+        # chunks that are regenerated after being saved already have their entities
+        _spawned = chunk_index == (0, 0) or chunk_index in self.regions
         for rel_y in range(CH):
             for rel_x in range(CW):
                 # init
                 block_pos = block_x, block_y = chunk_x * CW + rel_x, chunk_y * CH + rel_y
-                name = og_name = self.data[chunk_index].get(block_pos, None)
+                name = placed.get(block_pos, chunk.data.get(block_pos, None))
 
                 # topmost block (soil or something)
                 if name == bio.blocks[biome][0] and _get((block_x, block_y - 1)) == "air":
                     # forest modifications
                     if biome == Biome.FOREST:
                         # entitites
-                        if not _spawned and chunk_index == (0, 0):
-                            _spawned = True
-                        if _chance(1 / 1) and not _spawned:
+                        if stage == ChunkStage.ENTITIES and not _spawned:
                             create_entity(
                                 Transform(Vec2(0, 0), Vec2(0, 0), gravity=0, sines=[0, 5]),
                                 Mob(MobType.NEUTRAL),
@@ -326,56 +682,22 @@ class World:
                         # )
                         
                         # poppy
-                        if _chance(1 / 20):
+                        if stage == ChunkStage.DECORATIONS and _chance(1 / 20):
                             if _chance(0.6):
                                 poppy_color = "red"
                             else:
                                 poppy_color = "yellow"
                             _set(f"{poppy_color}-poppy", (block_x, block_y - 1))
 
-                        # forest tree
-                        if _chance(1 / 24):
-                            tree_height = _nordis(9, 2)
-                            for tree_yo in range(tree_height):
-                                wood_x, wood_y = block_x, block_y - tree_yo - 1 - 5
-                                wood_suffix = ""
-                                leaf_name = "leaf_f"
-                                leaf_chance = 1 / 2.4
-                                if tree_yo > 0:
-                                    if _chance(leaf_chance):
-                                        wood_suffix += "L"
-                                        _set(leaf_name, (wood_x - 1, wood_y))
-                                    if _chance(leaf_chance):
-                                        wood_suffix += "R"
-                                        _set(leaf_name, (wood_x + 1, wood_y))
-                                    if tree_yo == tree_height - 1:
-                                        wood_suffix += "T"
-                                        _set(leaf_name, (wood_x, wood_y - 1))
-                                wood_suffix = "N" if not wood_suffix else wood_suffix
-                                wood_name = f"wood_f_vr{wood_suffix}"
-                                _set(wood_name, (wood_x, wood_y))
-                    
                     elif biome == Biome.BEACH:
                         # rock
-                        if _chance(1 / 15):
+                        if stage == ChunkStage.DECORATIONS and _chance(1 / 15):
                             _set("rock" | X.b, (block_x, block_y - 1))
-
-                        # beach tree
-                        if _chance(1 / 24):
-                            # tree stem
-                            tree_height = _nordis(9, 2)
-                            for tree_yo in range(tree_height):
-                                wood_x, wood_y = block_x, block_y - tree_yo - 1
-                                _set("wood_p", (wood_x, wood_y))
-                            leaf_x, leaf_y = wood_x, wood_y
-                            # trees
-                            _set("leaf_f", (wood_x - 1, wood_y))
-                            _set("leaf_f", (wood_x, wood_y - 1))
-                            _set("leaf_f", (wood_x + 1, wood_y))
                 
                 # populate the ore veins
                 if (
-                    bwand(name, BF.ORE)
+                    stage == ChunkStage.ORES
+                    and bwand(name, BF.ORE)
                     and _get((block_x, block_y - 1)) is not None and nbwand(_get((block_x, block_y - 1)), BF.ORE)
                     and _get((block_x + 1, block_y)) is not None and nbwand(_get((block_x + 1, block_y)), BF.ORE)
                     and _get((block_x, block_y + 1)) is not None and nbwand(_get((block_x, block_y + 1)), BF.ORE)
@@ -391,10 +713,9 @@ class World:
                         elif direc == 3: ore_y -= 1
                         _set(name, (ore_x, ore_y))
 
-                # update chunk data and blit block image
-                if name != og_name:
-                    self.set(chunk_index, block_pos, name)
-    
+        # structures can reach further than the neighbouring chunk, so the writes are grouped by the chunk they land in
+        return structures.group_writes([*placed.keys()], blocks.registry.lut(placed.values()))
+
     def get(self, chunk_index, block_pos):
         if chunk_index in self.data:
             return self.data[chunk_index].get(block_pos, False)
@@ -408,87 +729,35 @@ class World:
         - modify the lighting
         - propagate the lighting
         """
-        cur = None
+        cur = self.data[chunk_index].get(block_pos)
         propagate_light = False
-        overwrite_foreground = False  # overwrite means the tile foreground disappears and becomes all background
 
-        if block_pos in self.data[chunk_index]:
-            cur = self.data[chunk_index][block_pos]
-
-            # deleting a light source (depropagate)
-            if bwand(cur, BF.LIGHT_SOURCE):
-                if chunk_index in self.source_to_children and self.source_to_children[chunk_index].get(block_pos, False):
-                    light_shares: dict[tuple[Pos, Pos], int] = {}
-                    # for all light children, check the distance to all other light sources
-                    for child_chunk_index, child_block_pos in [*self.source_to_children[chunk_index][block_pos]]:
-                        #
-                        check_radius = 1
-                        for yo in range(-check_radius, check_radius + 1):
-                            for xo in range(-check_radius, check_radius + 1):
-                                nei_chunk_index = (chunk_index[0] + xo, chunk_index[1] + yo)
-                                if nei_chunk_index not in self.data:
-                                    self.create_chunk(nei_chunk_index)
-                                
-                                for nei_light_block_pos in self.source_to_children[nei_chunk_index]:
-                                    if (nei_chunk_index, nei_light_block_pos) != (chunk_index, block_pos):
-                                        nei_light_name = self.data[nei_chunk_index][nei_light_block_pos]
-                                        light_power = blocks.params[nei_light_name]["light"]
-                                        dist = abs(nei_light_block_pos[0] - child_block_pos[0]) + abs(nei_light_block_pos[1] - child_block_pos[1])
-                                        light_value_from_other_source = light_power - dist * blocks.params[nei_light_name].get("light_falloff", 1)
-                                        light_shares[(nei_chunk_index, nei_light_block_pos)] = light_value_from_other_source
-                        
-                        # check if there are light sources in the vicinity
-                        if light_shares:
-                            # save the source that illuminates the given block the most
-                            max_light_key = max(light_shares, key=light_shares.get)
-                            max_light_value = light_shares[max_light_key]
-                            if max_light_value > 0:
-                                self.update_lightmap(child_chunk_index, child_block_pos, max_light_value)
-                                # transfer this child the other light source's child, because it has taken over it
-                                self.add_child_to_source(max_light_key, (child_chunk_index, child_block_pos))
-                            else:
-                                self.update_lightmap(child_chunk_index, child_block_pos, 0)
-                        else:
-                            # the block can't possibly be shared by any other light sources, so it just becomes black
-                            self.update_lightmap(child_chunk_index, child_block_pos, 0)
-
-                    self.remove_all_children_from_source((chunk_index, block_pos))
-
-        if not self.cache_chunk_textures:
-            # if not caching textures, wall textures are important
-            base, mods = blocks.norm(name)
-
-            # if the current block is not a decor, overwrite the thing
-            if "b" in mods:
-                self.wall_data[chunk_index][block_pos] = name
-                if cur is None or nbwand(cur, BF.DECOR):
-                    overwrite_foreground = True
-            
         # setting the actual data
-        if overwrite_foreground:
-            if cur is not None:
-                self.data[chunk_index][block_pos] = "air"
-            else:
-                self.data[chunk_index][block_pos] = name
-        else:
-            self.data[chunk_index][block_pos] = name
+        chunk = self.chunks[chunk_index]
+        rel = (block_pos[1] % CH, block_pos[0] % CW)
+        old_id = chunk.blocks[rel]
+        self.write_block(chunk, block_pos, name)
+
+        # changes after the generation can't be reproduced from the seed, so they have to be saved
+        if chunk.stage == ChunkStage.FULL:
+            chunk.edit(block_pos)
         
-        if bwand(name, BF.LIGHT_SOURCE):
+        # sunlight only has to be updated if the block lets it through differently (once for all the blocks that change until then)
+        if lighting.transparency(old_id) != lighting.transparency(chunk.blocks[rel]):
+            self.sky_dirty.add(chunk_index)
+
+        if cur is not None and bwand(cur, BF.LIGHT_SOURCE):
+            # deleting a light source (depropagate, the new block shines if it's a light source too)
+            self.light_queue.append((chunk_index, block_pos, True))
+        elif bwand(name, BF.LIGHT_SOURCE):
             # update lightmap when a light source is placed
             light = blocks.params[name]["light"]
-
-            child_key = (chunk_index, block_pos)
-            self.remove_child_from_source(child_key)
-                
             self.update_lightmap(chunk_index, block_pos, light)
             if allow_propagation:
                 propagate_light = True
-        else:
-            if block_pos not in self.lightmap[chunk_index]:
-                self.update_lightmap(chunk_index, block_pos, 0)
         
-        # cache chunk texture if wanted
-        if self.cache_chunk_textures:
+        # cache chunk texture if wanted (far away chunks don't have a surface)
+        if self.cache_chunk_textures and chunk_index in self.chunk_surfaces:
             # update chunk surface
             base, mods = blocks.norm(name)
             if "b" in mods:
@@ -496,140 +765,159 @@ class World:
             else:
                 image = blocks.surf_images[base]
 
-            # update surface -> texture method
-            self.chunk_surfaces[chunk_index].blit(image, (block_pos[0] % CW * BS, block_pos[1] % CH * BS))
-            if window.gpu:
-                self.chunk_textures[chunk_index] = pgb.T(self.chunk_surfaces[chunk_index])
-            # update texture directly method
+            # update surface (the texture follows once before the chunk is rendered)
+            blit_rect = self.chunk_surfaces[chunk_index].blit(image, (block_pos[0] % CW * BS, block_pos[1] % CH * BS))
+            self.mark_texture_dirty(chunk_index, blit_rect)
 
         # update lighting surface
         if propagate_light:
-            self.propagate_light(chunk_index, block_pos)
+            self.light_queue.append((chunk_index, block_pos, False))
+    
+    def write_block(self, chunk, block_pos, name):
+        # writes a block into the grids of a chunk, without updating lighting or surfaces
+        cur = chunk.data.get(block_pos)
+        overwrite_foreground = False  # overwrite means the tile foreground disappears and becomes all background
+
+        if not self.cache_chunk_textures:
+            # if not caching textures, wall textures are important
+            base, mods = blocks.norm(name)
+
+            # if the current block is not a decor, overwrite the thing
+            if "b" in mods:
+                chunk.wall_data[block_pos] = name
+                if cur is None or nbwand(cur, BF.DECOR):
+                    overwrite_foreground = True
+
+        if overwrite_foreground and cur is not None:
+            chunk.data[block_pos] = "air"
+        else:
+            chunk.data[block_pos] = name
     
+    def write_blocks(self, chunk, cells, ids):
+        # same as write_block for many generated blocks at once (cells are flat indices into the grids of the chunk)
+        if not self.cache_chunk_textures:
+            walls = blocks.registry.mask("walls", lambda name: "b" in blocks.norm(name)[1])[ids]
+            decor = blocks.registry.mask("decor", lambda name: bwand(name, BF.DECOR))
+            cur = chunk.blocks.reshape(-1)[cells]
+            chunk.walls.reshape(-1)[cells[walls]] = ids[walls]
+            ids = np.where(walls & (cur != 0) & ~decor[cur], blocks.registry.id("air"), ids)
+        chunk.blocks.reshape(-1)[cells] = ids
+
     def init_light(self, chunk_index):
         # initializes empty lighting data for the given chunk (if it doesn't already exist)
         if chunk_index not in self.lightmap:
-            self.lightmap[chunk_index] = {}
-            self.source_to_children[chunk_index] = {}
+            self.lightmap[chunk_index] = self.get_chunk(chunk_index).lightmap
 
             if self.cache_light_textures:
-                self.light_surfaces[chunk_index] = pygame.Surface((CW * BS, CH * BS), pygame.SRCALPHA)
-                if window.gpu:
-                    self.light_textures[chunk_index] = pgb.T(self.light_surfaces[chunk_index])
+                self.light_dirty.add(chunk_index)
+
+    def render_light_surface(self, chunk_index):
+        # builds the light surface (and texture) of the chunk from its light grids in one go
+        self.light_surfaces[chunk_index] = surf = lighting.shade_surface(self.visible_light(chunk_index))
+        if window.gpu:
+            self.light_textures[chunk_index] = pgb.T(surf)
+            self.texture_uploads += 1
+        self.light_dirty.discard(chunk_index)
+
+    def render_light_surfaces(self, budget):
+        """
+        Rebuilds the light surfaces of the chunks on screen whose light has changed until the budget (in ms) is used up.
+        Returns whether there are light surfaces left to rebuild.
+        """
+        start = time.perf_counter()
+        for chunk_index in [c for c in self.light_dirty if c in self.rendered_chunks and c in self.light_surfaces]:
+            if (time.perf_counter() - start) * 1000 >= budget:
+                return True
+            self.render_light_surface(chunk_index)
+        return False
 
     def create_chunk(self, chunk_index):
+        # generate the chunk right away
+        self.advance(chunk_index, ChunkStage.FULL, sync=True)
+
+    def setup_chunk(self, chunk_index):
         # initialize new chunk containers where data will be populated such as chunk texture, chunk data, lighting information, etc.
-        chunk_x, chunk_y = chunk_index
         # data
-        self.data[chunk_index] = {}
-        self.wall_data[chunk_index] = {}
-        self.bg_data[chunk_index] = {}
+        chunk = self.get_chunk(chunk_index)
+        self.data[chunk_index] = chunk.data
+        self.wall_data[chunk_index] = chunk.wall_data
+        self.bg_data[chunk_index] = chunk.bg_data
+        self.chunk_lru[chunk_index] = None
 
         # textures
-        self.chunk_surfaces[chunk_index] = pygame.Surface((CW * BS, CH * BS), pygame.SRCALPHA)
-        if window.gpu and self.cache_chunk_textures:
-            self.chunk_textures[chunk_index] = pgb.T(self.chunk_surfaces[chunk_index])
+        if self.cache_chunk_textures:
+            self.chunk_surfaces[chunk_index] = pygame.Surface((CW * BS, CH * BS), pygame.SRCALPHA)
         self.chunk_colors[chunk_index] = [rand(0, 255) for _ in range(3)]
         
         # lighting
         self.init_light(chunk_index)
+        return chunk
 
-        # generate the chunk
-        biome = Biome.FOREST
-        
-        for rel_y in range(CH):
-            for rel_x in range(CW):
-                # init variables
-                block_x, block_y = chunk_x * CW + rel_x, chunk_y * CH + rel_y
+    def build_chunk(self, chunk_index):
+        # the last stage: the chunk gets its saved edits back (the region files are read lazily), becomes visible and is lit
+        chunk = self.setup_chunk(chunk_index)
+        record = self.regions.load(chunk_index)
+        if record is not None:
+            chunk.unpack(record)
+            # the saved entities wake up again
+            restore_entities(record["entities"], chunk_index)
 
-                # chunks 0 and 1 need 1D noise for terrain height
-                if 0 <= block_y < 32:
-                    offset = int(self.fast_noise(block_x, 0, freq=0.04) * CW * 0.5)
-                    # offset = 0
-                
-                if block_y < 0:
-                    # SKY
-                    name = "air"
-
-                elif 0 <= block_y < 16:
-                    # SURFACE LEVEL
-                    if rel_y == offset:
-                        # top block in a biome
-                        name = bio.blocks[biome][0]
-                        if name == "soil_f":
-                            self.bg_data[chunk_index][(block_x, block_y)] = "dirt_f" | X.b
-                        else:
-                            self.bg_data[chunk_index][(block_x, block_y)] = name | X.b
-                    elif rel_y < offset:
-                        # air
-                        name = "air"
-                    else:
-                        # underground blocks
-                        name = bio.blocks[biome][1]
-                        self.bg_data[chunk_index][(block_x, block_y)] = name | X.b
-
-                elif block_y < 32:
-                    # DIRT-STONE HYBRID
-                    if rel_y <= offset:
-                        name = bio.blocks[biome][1]
-                        self.bg_data[chunk_index][(block_x, block_y)] = name | X.b
-                    else:
-                        name = self.get_ore(block_y)
-                        self.bg_data[chunk_index][(block_x, block_y)] = "stone" | X.b
+        if self.cache_chunk_textures:
+            self.render_chunk_surface(chunk_index)
 
-                elif block_y < 320:
-                    # UNDERGROUND
-                    name = "stone" | X.b if self.fast_noise(block_x, block_y, freq=0.06) < 0.5 else self.get_ore(block_y)
-                    self.bg_data[chunk_index][(block_x, block_y)] = "stone" | X.b
-                
-                else:
-                    # DEPTH LIMIT
-                    name = "blackstone"
+        chunk.stage = ChunkStage.FULL
+        # the scheduler lights the chunk, which also spreads the light of the neighbours into it again (which got lost if it has been unloaded)
+        self.light_queue.append((chunk_index, None, False))
+        self.sky_dirty.add(chunk_index)
+    
+    def render_chunk_surface(self, chunk_index):
+        # blit every block of the chunk onto its surface at once
+        names = blocks.registry.names
+        self.chunk_surfaces[chunk_index].fill((0, 0, 0, 0))
+        batch = [
+            (blocks.surf_images[names[id_]], (rel_x * BS, rel_y * BS))
+            for rel_y, row in enumerate(self.chunks[chunk_index].blocks.tolist())
+            for rel_x, id_ in enumerate(row)
+            if id_
+        ]
+        self.chunk_surfaces[chunk_index].fblits(batch)
+        self.mark_texture_dirty(chunk_index)
+
+    def mark_texture_dirty(self, chunk_index, rect=None):
+        # remembers which area of the chunk surface has changed (the whole surface by default), merged with the earlier changes
+        if window.gpu:
+            rect = pygame.Rect(0, 0, CW * BS, CH * BS) if rect is None else rect
+            self.texture_dirty[chunk_index] = self.texture_dirty[chunk_index].union(rect) if chunk_index in self.texture_dirty else rect
 
-                self.set(chunk_index, (block_x, block_y), name, allow_propagation=False)
+    def upload_chunk_texture(self, chunk_index):
+        """
+        Brings the texture of the chunk up to date with its surface. Only the area that has changed since the last upload is updated,
+        so all blocks set in a chunk during a frame (e.g. by an explosion) end up in a single upload.
+        """
+        surf = self.chunk_surfaces[chunk_index]
+        rect = self.texture_dirty.pop(chunk_index, None)
+        if chunk_index in self.chunk_textures and rect is not None and rect.size != surf.size:
+            # the area is passed as a tuple, Texture.update ignores the position of Rect objects
+            self.chunk_textures[chunk_index].update(surf.subsurface(rect), tuple(rect))
+        else:
+            self.chunk_textures[chunk_index] = pgb.T(surf)
+        self.texture_uploads += 1
 
-        self.modify_chunk(chunk_index)
-        self.propagate_light(chunk_index)
-    
-    def get_ore(self, depth):
-        r = self.random.random() * 100  # in percent
-        if r <= 0.1:
-            return "diamond"
-        if r <= 0.5:
-            return "iron"
-        if r <= 1:
-            return "coal"
-        return "stone"
+    def upload_textures(self, budget):
+        """
+        Updates the textures of the chunks on screen whose surface has changed until the budget (in ms) is used up.
+        Returns whether there are textures left to update.
+        """
+        if not window.gpu:
+            return False
+        start = time.perf_counter()
+        for chunk_index in [c for c in self.texture_dirty if c in self.rendered_chunks]:
+            if (time.perf_counter() - start) * 1000 >= budget:
+                return True
+            self.upload_chunk_texture(chunk_index)
+        return False
 
     # L I G H T I N G  M E T H O D S
-    def add_child_to_source(self, src_key, child_key):
-        # add a new child to the source
-        try:
-            self.source_to_children[src_key[0]][src_key[1]].add(child_key)
-        except KeyError:
-            self.source_to_children[src_key[0]][src_key[1]] = {child_key}
-        # assing a source to the child
-        self.child_to_source[child_key] = src_key
-    
-    def remove_all_children_from_source(self, src_key):
-        # iterate over all children of the given source 
-        for child_key in self.source_to_children[src_key[0]][src_key[1]]:
-            if self.child_to_source[child_key] == src_key:
-                # remove source from the child
-                del self.child_to_source[child_key]
-        # remove all children from source
-        del self.source_to_children[src_key[0]][src_key[1]]
-    
-    def remove_child_from_source(self, child_key):
-        # check if the child has any source parent
-        if child_key in self.child_to_source:
-            # get the source
-            src = self.child_to_source[child_key]
-            # remove the child form the source
-            self.source_to_children[src[0]][src[1]].remove(child_key)
-            # remove the source from the child
-            del self.child_to_source[child_key]
-
     def propagate_thread(self):
 
         
@@ -638,83 +926,178 @@ class World:
 
         self.light_thread_active = False
 
-    def propagate_light(self, chunk_index, block_pos=None):
-        if not self.menu.lighting:
-            return
-
-        def propagate():
-            nonlocal chunk_index, block_pos
-
-            # initialize data structures
-            queue = deque()
-            light_sources = set()
-
-            # save all light sources
-            for block_pos in (self.lightmap[chunk_index] if block_pos is None else (block_pos,)):
-                if block_pos not in self.data[chunk_index]:
-                    continue
-                name = self.data[chunk_index][block_pos]
-                if bwand(name, BF.LIGHT_SOURCE):
-                    light = blocks.params[name]["light"]
-                    light_sources.add((chunk_index, block_pos))
-                    self.update_lightmap(chunk_index, block_pos, light)
+    def visible_light(self, chunk_index):
+        # the light that gets rendered: the brightest of the block light and the sky light (scaled by the daylight)
+        chunk = self.chunks[chunk_index]
+        if self.daylight == 1:
+            return np.maximum(chunk.light, chunk.sky)
+        return np.maximum(chunk.light, (chunk.sky * self.daylight).astype(np.uint8))
 
-                    src_key = (chunk_index, block_pos)
-                    queue.append((chunk_index, block_pos, light, src_key))
-
-                    self.add_child_to_source(src_key, src_key)
-
-            # directions of propagation
-            offsets = [(1, 0), (0, 1), (-1, 0), (0, -1)]
-            n = 0
-            
-            # work through the queue in a breadth-first-search fashion
-            while queue:
-                n += 1
-                chunk_index, block_pos, desired_light, current_source = queue.popleft()
+    def set_daylight(self, daylight):
+        # the sky light doesn't change, only the light surfaces are redrawn
+        self.daylight = daylight
+        if self.cache_light_textures:
+            self.light_dirty.update(self.light_surfaces)
 
-                for (xo, yo) in offsets:
-                    new_chunk_index, new_block_pos = self.correct_tile(chunk_index, block_pos, xo, yo)
+    def gather(self, chunk_index, radius, get_grid):
+        """
+        Returns the grids of all chunks within the radius around the given one stacked into a single grid.
+        get_grid returns the grid of a chunk, or None for chunks that don't have one (which are all dark).
+        """
+        size = 2 * radius + 1
+        grid = np.zeros((size * CH, size * CW), dtype=np.uint8)
+        for yo in range(size):
+            for xo in range(size):
+                if (nei_grid := get_grid((chunk_index[0] + xo - radius, chunk_index[1] + yo - radius))) is not None:
+                    grid[yo * CH:(yo + 1) * CH, xo * CW:(xo + 1) * CW] = nei_grid
+        return grid
+
+    def scatter_light(self, chunk_index, grid, radius, channel="light"):
+        """
+        Writes a grid of light (from gather) back into the 3x3 chunks around the given one (the rest of the grid is only read)
+        and marks the light surfaces of the chunks that have changed as dirty
+        """
+        for yo in range(-1, 2):
+            for xo in range(-1, 2):
+                nei_chunk_index = (chunk_index[0] + xo, chunk_index[1] + yo)
+                y, x = (yo + radius) * CH, (xo + radius) * CW
+                light = grid[y:y + CH, x:x + CW]
+                if nei_chunk_index not in self.lightmap:
+                    if not light.any():
+                        continue
+                    self.init_light(nei_chunk_index)
+                chunk_light = getattr(self.chunks[nei_chunk_index], channel)
+                if not np.array_equal(chunk_light, light):
+                    chunk_light[:] = light
+                    if self.cache_light_textures:
+                        self.light_dirty.add(nei_chunk_index)
 
-                    new_light = desired_light - blocks.params[self.data[current_source[0]][current_source[1]]].get("light_falloff", 1)
+    def propagate_light(self, chunk_index, block_pos=None):
+        """
+        Spreads the light of the light sources in the chunk (or only of the given block) over the 3x3 chunks around it at once.
+        Light doesn't reach further than MAX_LIGHT blocks, which is less than a chunk. The light already in the neighbours
+        spreads along, so light from outside of the chunk gets into it as well.
+        """
+        if not self.menu.lighting:
+            return
 
-                    # make sure that the lighting data (lightmap and -surface) of neighboring chunk is initialized
-                    self.init_light(new_chunk_index)
+        grid = self.gather(chunk_index, 1, lambda c: self.chunks[c].light if c in self.lightmap else None)
+        center = grid[CH:2 * CH, CW:2 * CW]
+        emission = lighting.emission(self.chunks[chunk_index].blocks)
+        if block_pos is not None:
+            rel_x, rel_y = block_pos[0] - chunk_index[0] * CW, block_pos[1] - chunk_index[1] * CH
+            emission = np.where((np.arange(CH)[:, None] == rel_y) & (np.arange(CW) == rel_x), emission, 0)
+        np.maximum(center, emission, out=center)
+        lighting.flood(grid)
+        self.scatter_light(chunk_index, grid, 1)
+
+    def remove_light(self, chunk_index, block_pos):
+        """
+        Removes the light of a light source that has been removed from the given block. Only the area that it lit is updated,
+        which is always within the 3x3 chunks around it.
+        """
+        if not self.menu.lighting:
+            return
 
-                    # if the block doesn't exist yet, make it zero by default
-                    if new_block_pos not in self.lightmap[new_chunk_index]:
-                        self.update_lightmap(new_chunk_index, new_block_pos, 0)
+        grid = self.gather(chunk_index, 1, lambda c: self.chunks[c].light if c in self.lightmap else None)
+        # the light that the blocks of the built chunks emit
+        emission = self.gather(chunk_index, 1, lambda c: lighting.emission(self.chunks[c].blocks) if c in self.data else None)
+        rel_x, rel_y = block_pos[0] - chunk_index[0] * CW, block_pos[1] - chunk_index[1] * CH
+        lighting.remove(grid, emission, CH + rel_y, CW + rel_x)
+        self.scatter_light(chunk_index, grid, 1)
 
-                    # return if light becomes too dim
-                    if new_light < 0:
-                        continue
+    def exposure(self, chunk_index):
+        """
+        Returns in which columns sunlight enters the chunk from above. Above chunks that aren't built, there is assumed to be open sky
+        above the surface and solid ground below it.
+        """
+        above = (chunk_index[0], chunk_index[1] - 1)
+        if above in self.data and (sky_exit := self.chunks[above].sky_exit) is not None:
+            return sky_exit
+        return np.full(CW, chunk_index[1] <= 0)
 
-                    # if new lighting is higher than the lighting already there, overwrite it because this light source is brighter than its previous light source
-                    if new_light > self.lightmap[new_chunk_index][new_block_pos]:
-                        self.update_lightmap(new_chunk_index, new_block_pos, new_light, src_key=current_source)
-                        queue.append((new_chunk_index, new_block_pos, new_light, current_source))
-            
-        propagate()
+    def sunlit(self, chunk_index):
+        # the cells of a built chunk that the sun shines on, at full light
+        if chunk_index in self.data:
+            transparent = lighting.transparency(self.chunks[chunk_index].blocks)
+            return lighting.sunlight(transparent, self.exposure(chunk_index))[0] * MAX_LIGHT
 
-    def update_lightmap(self, chunk_index, block_pos, light, src_key=None):
-        # add this block to the contributions (children) of the given src_key
-        if src_key is not None:
-            child_key = (chunk_index, block_pos)
+    def update_sky(self, chunk_index):
+        """
+        Recomputes the sky light of the 3x3 chunks around the given one from the sunlit cells of the 5x5 chunks around it.
+        Sunlight only goes straight down and spreads sideways from there, so if the sunlight leaving the chunk at the bottom changes,
+        the chunks below are updated as well.
+        """
+        if not self.menu.lighting:
+            return
 
-            self.remove_child_from_source(child_key)
-            self.add_child_to_source(src_key, child_key)
+        while True:
+            self.sky_dirty.discard(chunk_index)
+            below = (chunk_index[0], chunk_index[1] + 1)
+            before = self.exposure(below)
+            chunk = self.chunks[chunk_index]
+            _, chunk.sky_exit = lighting.sunlight(lighting.transparency(chunk.blocks), self.exposure(chunk_index))
+
+            grid = self.gather(chunk_index, 2, lambda c: self.chunks[c].sky if c in self.lightmap else None)
+            grid[CH:4 * CH, CW:4 * CW] = 0
+            np.maximum(grid, self.gather(chunk_index, 2, self.sunlit), out=grid)
+            lighting.flood(grid)
+            self.scatter_light(chunk_index, grid, 2, "sky")
+
+            if below not in self.data or np.array_equal(before, self.exposure(below)):
+                break
+            chunk_index = below
+
+    def propagate_lights(self, budget):
+        """
+        Spreads and removes the light of the light sources that have been placed and removed, in that order, until the budget (in ms)
+        is used up. Returns whether there is light left to propagate.
+        """
+        start = time.perf_counter()
+        while self.light_queue:
+            if (time.perf_counter() - start) * 1000 >= budget:
+                return True
+            chunk_index, block_pos, removed = self.light_queue.popleft()
+            # unloaded chunks are lit again when they are built
+            if chunk_index not in self.data:
+                continue
+            if removed:
+                self.remove_light(chunk_index, block_pos)
+            else:
+                self.propagate_light(chunk_index, block_pos)
+        return False
 
-        self.lightmap[chunk_index][block_pos] = final_light_value = light
+    def update_skies(self, budget):
+        """
+        Recomputes the sky light of the chunks whose blocks have changed until the budget (in ms) is used up, from the top down,
+        so the chunks below are only updated once. Returns whether there are chunks left.
+        """
+        if not self.menu.lighting:
+            self.sky_dirty.clear()
+            return False
+
+        start = time.perf_counter()
+        while self.sky_dirty:
+            if (time.perf_counter() - start) * 1000 >= budget:
+                return True
+            # blocks might be set from other threads (e.g. by dynamite), so the set is copied first
+            chunk_index = min(list(self.sky_dirty), key=lambda c: c[1])
+            if chunk_index in self.data:
+                self.update_sky(chunk_index)
+            else:
+                self.sky_dirty.discard(chunk_index)
+        return False
 
-        # experimental
-        final_light_value = min(final_light_value, MAX_LIGHT - 1)
-        alpha = (MAX_LIGHT - 1 - final_light_value) / (MAX_LIGHT - 1) * 255
-        blit_pos = (block_pos[0] % CW * BS, block_pos[1] % CH * BS)
+    def flush_light(self):
+        # does all the light work that the scheduler has left at once (e.g. when there are no frames)
+        self.propagate_lights(float("inf"))
+        self.update_skies(float("inf"))
 
+    def update_lightmap(self, chunk_index, block_pos, light):
+        # the light surface is rebuilt once before the next lighting blit, no matter how many cells change until then
+        self.lightmap[chunk_index][block_pos] = light
         if self.cache_light_textures:
-            pygame.draw.rect(self.light_surfaces[chunk_index], (0, 0, 0, alpha), (*blit_pos, BS, BS))
-            if window.gpu:
-                self.light_textures[chunk_index] = pgb.T(self.light_surfaces[chunk_index])
+            self.light_dirty.add(chunk_index)
     
     # U P D A T E  L O O P
     def update(self, display, scroll, game, dt):
@@ -722,65 +1105,83 @@ class World:
         num_blocks = 0
         processed_chunks = []
         chunk_rects = []
-        block_rects = []
+        chunk_views = []
+
+        self.texture_uploads = 0
+
+        # generate the chunks the camera is heading to
+        start = time.perf_counter()
+        deadline = start + self.chunk_budget / 1000  # for the generation of chunks that aren't needed right away
+        profiler.begin("streaming")
+        player_vel = game.player.vel
+        self.prefetch(scroll, (game.scroll_vel[0] + player_vel[0], game.scroll_vel[1] + player_vel[1]), deadline)
+        self.evict_chunks(scroll)
+        profiler.end()
+        player_chunk = self.pos_to_tile(game.player.rect.center)[0]
 
         # R E N D E R  B L O C K S
-        for yo in range(self.num_ver_chunks):
-            for xo in range(self.num_hor_chunks):
+        profiler.begin("chunks")
+        (window_x, window_y), (num_hor_chunks, num_ver_chunks) = self.chunk_window(scroll)
+        visible = self.visible_blocks(scroll)
+        self.rendered_chunks.clear()
+        for yo in range(num_ver_chunks):
+            for xo in range(num_hor_chunks):
                 # get chunk coordinates from game scroll
-                chunk_x = xo - 1 + int(round(scroll[0] / (CW * BS)))
-                chunk_y = yo - 1 + int(round(scroll[1] / (CH * BS)))
+                chunk_x = window_x + xo
+                chunk_y = window_y + yo
                 chunk_index = (chunk_x, chunk_y)
+                chunk_topleft = chunk_index[0] * CW * BS - scroll[0], chunk_index[1] * CH * BS - scroll[1]
 
                 # create chunk in case it does not exist yet
-                # if chunk_index not in self.chunk_textures:
-                #     if chunk_index not in self.chunk_queue:
-                #         # self.create_chunk(chunk_index)
-                #         self.chunk_queue.append(chunk_index)
-                #     continue
                 if chunk_index not in self.data:
-                    self.create_chunk(chunk_index)
-
-                # check whether it is just late
-                if chunk_index in self.late_data:
-                    for block_pos, name in self.late_data[chunk_index].copy().items():
-                        self.set(chunk_index, block_pos, name)
-                        del self.late_data[chunk_index][block_pos]
+                    if self.pool is None or (abs(chunk_x - player_chunk[0]) <= 1 and abs(chunk_y - player_chunk[1]) <= 1):
+                        # no workers, or the chunks around the player can't wait for them
+                        self.create_chunk(chunk_index)
+                    else:
+                        self.advance(chunk_index, sync=False, deadline=deadline)
+                    if chunk_index not in self.data:
+                        # draw a placeholder until the worker pool has generated the terrain of the chunk and its neighbours
+                        pgb.fill_rect(display, PLACEHOLDER_COLOR, (*chunk_topleft, CW * BS, CH * BS))
+                        continue
+                self.chunk_lru.move_to_end(chunk_index)
 
-                # render the shunk surface
-                chunk_topleft = chunk_index[0] * CW * BS - scroll[0], chunk_index[1] * CH * BS - scroll[1]
+                # chunks in the margin of the chunk window are only processed (e.g. their entities), not rendered
                 chunk_rect = pygame.Rect((*chunk_topleft, CW * BS, CH * BS))
                 chunk_rects.append(chunk_rect)
+                chunk_views.append(view := self.chunk_view(chunk_index, visible))
+                processed_chunks.append(chunk_index)
+                if view is None:
+                    continue
+                self.rendered_chunks.add(chunk_index)
+
+                # surfaces of chunks that have been far away are rebuilt
+                if self.cache_chunk_textures and chunk_index not in self.chunk_surfaces:
+                    self.chunk_surfaces[chunk_index] = pygame.Surface((CW * BS, CH * BS), pygame.SRCALPHA)
+                    self.render_chunk_surface(chunk_index)
 
                 # potentially process individual blocks
                 if self.cache_chunk_textures:
                     num_blocks += len(self.data[chunk_index])
                 else:
-                    for block_pos, name in self.data[chunk_index].items():
-                        num_blocks += 1
-
-                        block_x, block_y = block_pos
-                        blit_rect = pygame.Rect(block_x * BS - scroll[0], block_y * BS - scroll[1], BS, BS)
-                        
-                        # render the block (background then foreground)
-                        if 0 <= blit_rect.right <= window.width + BS and 0 <= blit_rect.bottom <= window.height + BS:
-                      
-                            if (wall_name := self.wall_data[chunk_index].get(block_pos)) is not None:
-                                window.display.blit(blocks.images[wall_name], blit_rect)
-                            if name != "air":
-                                window.display.blit(blocks.images[name], blit_rect)
+                    chunk = self.chunks[chunk_index]
+                    num_blocks += len(self.data[chunk_index])
 
-                        # add a block that can be interacted with
-                        block_rects.append(blit_rect)
+                    # only the blocks that are (partially) on screen are drawn, all at once from the tile atlas
+                    rows, cols = view
+                    blit_topleft = (chunk_topleft[0] + cols.start * BS, chunk_topleft[1] + rows.start * BS)
+                    tilemap.draw_tiles(display, chunk.blocks[view], chunk.walls[view], blit_topleft)
 
                 # ! render chunk surface !
                 if self.cache_chunk_textures:
                     if window.gpu:
+                        # changed textures are updated by the scheduler, only missing ones can't wait
+                        if chunk_index not in self.chunk_textures:
+                            self.upload_chunk_texture(chunk_index)
                         display.blit(self.chunk_textures[chunk_index], chunk_rect)
                     else:
                         display.blit(self.chunk_surfaces[chunk_index], chunk_rect)
 
-                processed_chunks.append(chunk_index)
+        profiler.end()
 
         #  B E F O R E  L I G H T I N G  &  A F T E R  B L O C K S
         # for chunk_index in processed_chunks:
@@ -791,28 +1192,36 @@ class World:
             self.light_thread_active = True
         
         # process the render system
-        game.num_rendered_entities += game.render_system.process(game.scroll, self.menu.hitboxes, window, dt, chunks=processed_chunks)
+        with profiler.scope("entities"):
+            game.num_rendered_entities += game.render_system.process(game.scroll, self.menu.hitboxes, self.menu.collisions, window, dt, chunks=processed_chunks, last_positions=game.physics_system.last_positions, alpha=game.alpha)
 
         # update the player
-        game.player.update(window.display, dt)
+        with profiler.scope("player"):
+            game.player.update(window.display, dt)
         
         # L I G H T I N G  &  A F T E R
+        profiler.begin("lighting")
         if self.menu.lighting:
-            for chunk_index, chunk_rect in zip(processed_chunks, chunk_rects):
+            for chunk_index, chunk_rect, view in zip(processed_chunks, chunk_rects, chunk_views):
+                if view is None:
+                    continue
+                rows, cols = view
+
                 # ! render chunk lighting !
                 if self.cache_light_textures:
+                    # changed light surfaces are rebuilt by the scheduler, only missing ones can't wait
+                    if chunk_index not in self.light_surfaces:
+                        self.render_light_surface(chunk_index)
                     if window.gpu:
                         display.blit(self.light_textures[chunk_index], chunk_rect)
                     else:
                         display.blit(self.light_surfaces[chunk_index], chunk_rect)
                 else:
-                    for block_pos, light in self.lightmap[chunk_index].items():
-                        block_x, block_y = block_pos
-                        blit_rect = pygame.Rect(block_x * BS - scroll[0], block_y * BS - scroll[1], BS, BS)
-                        
-                        # render the block
-                        if 0 <= blit_rect.right <= window.width + BS and 0 <= blit_rect.bottom <= window.height + BS:
+                    for rel_y, row in enumerate(self.visible_light(chunk_index)[view].tolist(), rows.start):
+                        for rel_x, light in enumerate(row, cols.start):
+                            blit_rect = pygame.Rect(chunk_rect.x + rel_x * BS, chunk_rect.y + rel_y * BS, BS, BS)
 
+                            # render the block
                             final_light_value = min(light, MAX_LIGHT - 1)
                             alpha = (MAX_LIGHT - 1 - final_light_value) / (MAX_LIGHT - 1) * 255
 
@@ -827,29 +1236,20 @@ class World:
                 # show chunk borders
                 if self.menu.chunk_borders.checked:
                     pgb.draw_rect(display, self.chunk_colors[chunk_index], chunk_rect, 1)
-                    pgb.write(display, "center", chunk_index, fonts.orbitron[20], WHITE, *chunk_rect.center)
-                    pgb.write(display, "center", (chunk_index[0] * CW, chunk_index[1] * CH), fonts.orbitron[12], WHITE, chunk_rect.centerx, chunk_rect.centery + 30)
+                    text.write(display, "center", chunk_index, fonts.orbitron[20], WHITE, *chunk_rect.center)
+                    text.write(display, "center", (chunk_index[0] * CW, chunk_index[1] * CH), fonts.orbitron[12], WHITE, chunk_rect.centerx, chunk_rect.centery + 30)
                 
                 # debug stuff per block
                 if self.menu.debug_lighting:
-                    for block_pos, name in self.lightmap[chunk_index].items():
-                        block_x, block_y = block_pos
-                        blit_pos = (block_x * BS - scroll[0], block_y * BS - scroll[1])
-                        try:
-                            pgb.write(window.display, "center", len(self.source_to_children[chunk_index][block_pos]), fonts.orbitron[12], pygame.Color("cyan"), blit_pos[0] + BS / 2, blit_pos[1] + BS / 2)
-                        except Exception:
-                            pass
-                        finally:
-                            pgb.write(window.display, "center", self.lightmap[chunk_index][block_pos], fonts.orbitron[12], pygame.Color("orange"), blit_pos[0] + BS / 2, blit_pos[1] + BS / 2)
-
-                        if self.screen_pos_to_tile(pygame.mouse.get_pos(), scroll) == (chunk_index, block_pos):
-                            if chunk_index in self.source_to_children and block_pos in self.source_to_children[chunk_index]:
-                                for child_index, child_pos in self.source_to_children[chunk_index][block_pos]:
-                                    bp = (child_pos[0] * BS - scroll[0], child_pos[1] * BS - scroll[1])
-                            
-                            elif (chunk_index, block_pos) in self.child_to_source:
-                                src_pos = self.child_to_source[(chunk_index, block_pos)][1]
-                                bp = (src_pos[0] * BS - scroll[0], src_pos[1] * BS - scroll[1])
+                    chunk = self.chunks[chunk_index]
+                    for rel_y, (row, sky_row) in enumerate(zip(chunk.light[view].tolist(), chunk.sky[view].tolist()), rows.start):
+                        for rel_x, (light, sky) in enumerate(zip(row, sky_row), cols.start):
+                            blit_pos = (chunk_rect.x + rel_x * BS, chunk_rect.y + rel_y * BS)
+                            # block light and sky light
+                            text.write(window.display, "center", light, fonts.orbitron[12], pygame.Color("orange"), blit_pos[0] + BS / 2, blit_pos[1] + BS / 3)
+                            text.write(window.display, "center", sky, fonts.orbitron[12], pygame.Color("cyan"), blit_pos[0] + BS / 2, blit_pos[1] + BS * 2 / 3)
+
+        profiler.end()
 
         # show the breaking block
         if (self.breaking.index, self.breaking.pos) != (None, None):
@@ -876,8 +1276,21 @@ class World:
                 # render the block breaking spritesheet
                 display.blit(blocks.breaking_sprs[int(self.breaking.anim)], self.breaking.rect)
 
+        # D E F E R R E D  W O R K
+        with profiler.scope("jobs"):
+            self.scheduler.run(self.job_time(start))
+
         # return information processed along the way
-        return num_blocks, processed_chunks, block_rects
+        return num_blocks, processed_chunks
+
+    def job_time(self, frame_start):
+        """
+        Returns how long (in ms) the deferred work may run this frame: its share of the frame time at the fps cap,
+        or less if the frame is already running late, but never less than MIN_JOB_BUDGET
+        """
+        frame_time = 1000 / self.menu.fps_cap.value
+        elapsed = (time.perf_counter() - frame_start) * 1000
+        return max(min(frame_time * self.job_budget, frame_time - elapsed), MIN_JOB_BUDGET)
 
     def drop_broken_block(self):
         # coordinates for the drop
@@ -886,7 +1299,6 @@ class World:
 
         # drop a normal block (not a variation)
         drop_name, mods, vers = blocks.drop(self.data[self.breaking.index][self.breaking.pos])
-        drop_img = pgb.scale_by(blocks.surf_images[drop_name], 0.5)
 
         # create the enity
         create_entity(
@@ -896,7 +1308,7 @@ class World:
                 gravity=0.03,
             ),
             Hitbox((x, y), (0, 0), anchor="center"),
-            Sprite.from_img(drop_img),
+            Sprite.from_block(drop_name, 0.5),
             Drop(drop_name),
             chunk=self.breaking.index
         )